@@ -34,21 +34,59 @@ bl_info = {
     "wiki_url": "https://github.com/BorisTheBrave/celtic-knot/wiki",
     "category": "Add Curve"}
 
-import bpy
-import bmesh
-from bpy_extras import object_utils
+try:
+    import bpy
+    import bmesh
+    from bpy_extras import object_utils
+    from bpy_extras.io_utils import ExportHelper
+    from bpy.app.handlers import persistent
+    from mathutils import Color
+    HAS_BLENDER = True
+except ImportError:
+    # Without Blender, only the computation is available (as used by worker processes and the command line)
+    HAS_BLENDER = False
+from array import array
 from collections import defaultdict
-from mathutils import Color
-from math import pi, sin, cos
-from random import random, seed, choice, randrange
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from math import pi, sin, cos, floor
+import multiprocessing
+import os
+import sys
+from random import seed, choice, randrange
+from threading import Thread
+from time import perf_counter
+from types import SimpleNamespace
+import traceback
+import numpy as np
+
+if not HAS_BLENDER:
+    # Stand-ins for what the operator class bodies use, so they can still be defined (though never registered)
+    bpy = SimpleNamespace(types=SimpleNamespace(Operator=type("Operator", (), {})),
+                          props=SimpleNamespace(**{name: lambda *args, **kwargs: None for name in (
+                              "BoolProperty", "EnumProperty", "FloatProperty", "IntProperty", "StringProperty")}))
+    ExportHelper = type("ExportHelper", (), {})
+    persistent = lambda function: function
 
 HANDLE_TYPE_MAP = {"AUTO": "AUTOMATIC", "ALIGNED": "ALIGNED"}
 
-# Twist types
-TWIST_CW = "TWIST_CW"
-STRAIGHT = "STRAIGHT"
-TWIST_CCW = "TWIST_CCW"
-IGNORE = "IGNORE"
+# Twist types, stored one byte per edge in uint8 arrays
+UNASSIGNED = 0
+TWIST_CW = 1
+STRAIGHT = 2
+TWIST_CCW = 3
+IGNORE = 4
+
+# Name of the edge attribute twists are stored in
+TWIST_ATTRIBUTE = "celtic_twist"
+NO_STORED_TWISTS = "No stored twists for this mesh and remesh type"
+
+# Names of the attributes written by attribute coloring
+STRAND_ATTRIBUTE = "celtic_strand"
+BRAID_ATTRIBUTE = "celtic_braid"
+PARAM_ATTRIBUTE = "celtic_param"
+ATTRIBUTE_MATERIAL = "CelticKnot Attributes"
 
 # output types
 BEZIER = "BEZIER"
@@ -80,6 +118,36 @@ def edge_midpoint(edge):
     return (v1.co + v2.co) / 2.0
 
 
+def get_edge_midpoints(bm):
+    """Returns a list of the midpoint of each edge."""
+    return [edge_midpoint(e) for e in bm.edges]
+
+
+class EdgeMidpoints(dict):
+    """The midpoints of edges by index, like get_edge_midpoints, but only computed for the edges used."""
+    def __init__(self, bm):
+        super().__init__()
+        bm.edges.ensure_lookup_table()
+        self.edges = bm.edges
+
+    def __missing__(self, edge_index):
+        midpoint = self[edge_index] = edge_midpoint(self.edges[edge_index])
+        return midpoint
+
+
+def get_edge_verts(bm):
+    """Returns an array of the two vertex indices of each edge."""
+    edge_verts = np.empty((len(bm.edges), 2), dtype=np.intc)
+    for edge in bm.edges:
+        edge_verts[edge.index] = edge.verts[0].index, edge.verts[1].index
+    return edge_verts
+
+
+def get_edge_face_counts(bm):
+    """Returns an array of the number of faces using each edge."""
+    return np.fromiter((len(edge.link_loops) for edge in bm.edges), dtype=np.intc, count=len(bm.edges))
+
+
 def bmesh_from_pydata(vertices, faces):
     bm = bmesh.new()
     for v in vertices:
@@ -90,6 +158,7 @@ def bmesh_from_pydata(vertices, faces):
         bm.faces.new([bm.verts[v] for v in f])
     bm.edges.index_update()
     bm.edges.ensure_lookup_table()
+    bm.faces.index_update()
     i = 0
     for edge in bm.edges:
         for loop in edge.link_loops:
@@ -98,6 +167,162 @@ def bmesh_from_pydata(vertices, faces):
     return bm
 
 
+## Blender-free meshes (a stand-in for bmesh that can be used away from Blender's main thread)
+
+class PyMeshSeq(list):
+    """A list with the methods of bmesh sequences used in this file."""
+    def ensure_lookup_table(self):
+        pass
+
+    def index_update(self):
+        for i, elem in enumerate(self):
+            elem.index = i
+
+
+class PyVector(np.ndarray):
+    """A numpy array with the methods of mathutils vectors used in this file."""
+    def normalize(self):
+        length = np.linalg.norm(self)
+        if length > 0:
+            self /= length
+
+    def normalized(self):
+        vector = self.copy()
+        vector.normalize()
+        return vector
+
+    def cross(self, other):
+        return np.cross(self, other).view(PyVector)
+
+
+class PyVert:
+    __slots__ = ("index", "co", "link_edges")
+
+    def __init__(self, index, co):
+        self.index = index
+        self.co = co
+        self.link_edges = []
+
+
+class PyEdge:
+    __slots__ = ("index", "verts", "link_loops")
+
+    def __init__(self, index, v1, v2):
+        self.index = index
+        self.verts = (v1, v2)
+        self.link_loops = []
+
+
+class PyLoop:
+    __slots__ = ("index", "vert", "edge", "face", "link_loop_next", "link_loop_prev")
+
+    def __init__(self, index, vert, edge, face):
+        self.index = index
+        self.vert = vert
+        self.edge = edge
+        self.face = face
+        self.link_loop_next = None
+        self.link_loop_prev = None
+
+    def calc_normal(self):
+        """The normal of the corner, or of the face for straight corners, like bmesh."""
+        v = self.vert.co
+        normal = (self.link_loop_next.vert.co - v).cross(self.link_loop_prev.vert.co - v)
+        if np.linalg.norm(normal) < 1e-12:
+            return self.face.calc_normal()
+        return normal.normalized()
+
+    @property
+    def link_loops(self):
+        """The other loops of the same edge, in radial order."""
+        radial = self.edge.link_loops
+        i = radial.index(self)
+        return radial[i + 1:] + radial[:i]
+
+
+class PyFace:
+    __slots__ = ("index", "loops")
+
+    def __init__(self, index):
+        self.index = index
+        self.loops = []
+
+    @property
+    def verts(self):
+        return [loop.vert for loop in self.loops]
+
+    @property
+    def edges(self):
+        return [loop.edge for loop in self.loops]
+
+    def calc_center_median(self):
+        return sum(loop.vert.co for loop in self.loops) / len(self.loops)
+
+    def calc_normal(self):
+        # Newell's method
+        return sum(loop.vert.co.cross(loop.link_loop_next.vert.co) for loop in self.loops).normalized()
+
+
+class PyMesh:
+    """Implements the parts of the bmesh API needed to remesh, compute twists and trace strands,
+    without needing Blender. Vertex positions are rows of a numpy array, viewed as PyVectors.
+    Elements are created in the same order as bmesh.from_mesh would,
+    with edges first (if given), and loops indexed in face order."""
+    def __init__(self, vertices, faces, edges=()):
+        self.co = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+        self.verts = PyMeshSeq(PyVert(i, co) for i, co in enumerate(self.co.view(PyVector)))
+        self.edges = PyMeshSeq()
+        self.faces = PyMeshSeq()
+        self.edge_lookup = {}
+        for v1, v2 in edges:
+            self.get_edge(self.verts[v1], self.verts[v2])
+        loop_count = 0
+        for face_verts in faces:
+            face = PyFace(len(self.faces))
+            verts = [self.verts[v] for v in face_verts]
+            for v1, v2 in cyclic_zip(verts):
+                edge = self.get_edge(v1, v2)
+                loop = PyLoop(loop_count, v1, edge, face)
+                loop_count += 1
+                # Like bmesh, the new loop becomes the first of the radial cycle,
+                # followed by the loop after the old first one.
+                radial = edge.link_loops
+                edge.link_loops = [loop] + radial[1:] + radial[:1]
+                face.loops.append(loop)
+            for prev_loop, loop in cyclic_zip(face.loops):
+                prev_loop.link_loop_next = loop
+                loop.link_loop_prev = prev_loop
+            self.faces.append(face)
+
+    def get_edge(self, v1, v2):
+        key = (v1.index, v2.index) if v1.index < v2.index else (v2.index, v1.index)
+        edge = self.edge_lookup.get(key)
+        if edge is None:
+            edge = self.edge_lookup[key] = PyEdge(len(self.edges), v1, v2)
+            self.edges.append(edge)
+            v1.link_edges.append(edge)
+            v2.link_edges.append(edge)
+        return edge
+
+    @classmethod
+    def from_pydata(cls, vertices, faces):
+        """Equivalent of bmesh_from_pydata."""
+        mesh = cls(vertices, faces)
+        i = 0
+        for edge in mesh.edges:
+            for loop in edge.link_loops:
+                loop.index = i
+                i += 1
+        return mesh
+
+
+def mesh_from_pydata(like, vertices, faces):
+    """Creates a mesh of the same kind (bmesh or PyMesh) as like."""
+    if isinstance(like, PyMesh):
+        return PyMesh.from_pydata(vertices, faces)
+    return bmesh_from_pydata(vertices, faces)
+
+
 ## Remeshing operations (replacing one bmesh with another)
 
 def remesh_midedge_subdivision(bm):
@@ -121,7 +346,7 @@ def remesh_midedge_subdivision(bm):
             new_face.append(vert_index_to_new_index[loop.vert.index])
             new_face.append(edge_index_to_new_index[loop.edge.index])
         new_faces.append(new_face)
-    return bmesh_from_pydata(new_verts, new_faces)
+    return mesh_from_pydata(bm, new_verts, new_faces)
 
 
 def remesh_medial(bm):
@@ -152,7 +377,7 @@ def remesh_medial(bm):
             v2 = edge_index_to_new_index[loop2.edge.index]
             new_faces.append([v0, v2, v1])
 
-    return bmesh_from_pydata(new_verts, new_faces)
+    return mesh_from_pydata(bm, new_verts, new_faces)
 
 
 REMESH_TYPES = [("NONE", "None", ""),
@@ -169,6 +394,16 @@ def remesh(bm, remesh_type):
         return remesh_medial(bm)
 
 
+def remesh_vertex_values(edge_verts, values, remesh_type):
+    """Converts an array of per vertex values (such as positions) of a mesh
+    to the vertices of the mesh after remesh(bm, remesh_type).
+    edge_verts is get_edge_verts of the original mesh.
+    Vertices created at edge midpoints get the average of the edge's values."""
+    if remesh_type is None or remesh_type == "NONE":
+        return values
+    return np.concatenate((values, values[edge_verts].mean(axis=1)))
+
+
 class DirectedLoop:
     """Stores an edge loop and a particular facing along it."""
     def __init__(self, loop, forward):
@@ -210,97 +445,114 @@ class DirectedLoop:
             return DirectedLoop(loop, forward)
 
 
-def get_celtic_twists(bm, twist_prob):
-    """Gets a twist per edge for celtic knot style patterns.
-    These are also called "plain weavings"."""
-    seed(0)
-    twists = []
-    for edge in bm.edges:
-        if len(edge.link_loops) == 0:
-            twists.append(IGNORE)
-        else:
-            if random() < twist_prob:
-                twists.append(TWIST_CW)
-            else:
-                twists.append(STRAIGHT)
+def random_celtic_twists(ignored, twist_prob, weights=None, rng_seed=0):
+    """Gets a twist array for celtic knot style patterns,
+    drawing every edge at once from a seeded generator.
+    ignored is a boolean array of edges with no faces.
+    weights optionally scales twist_prob per edge."""
+    prob = twist_prob if weights is None else twist_prob * np.asarray(weights)
+    twist = np.random.default_rng(rng_seed).random(len(ignored)) < prob
+    twists = np.where(twist, TWIST_CW, STRAIGHT).astype(np.uint8)
+    twists[ignored] = IGNORE
     return twists
 
 
+def get_celtic_twists(bm, twist_prob, vertex_weights=None):
+    """Gets a twist per edge for celtic knot style patterns.
+    These are also called "plain weavings".
+    vertex_weights optionally scales twist_prob, averaged over the ends of each edge."""
+    if vertex_weights is None:
+        weights = None
+    else:
+        weights = np.asarray(vertex_weights)[get_edge_verts(bm)].mean(axis=1)
+    return random_celtic_twists(get_edge_face_counts(bm) == 0, twist_prob, weights)
+
+
+def twist_view(twists):
+    """Returns a view of a twist array that is fast to index from python."""
+    return memoryview(np.ascontiguousarray(twists, dtype=np.uint8))
+
+
 def strand_part(prev_loop, loop, forward):
     """A strand part uniquely identifies one point on a strand
-    crossing a particular edge."""
-    return forward, frozenset((prev_loop.index, loop.index))
+    crossing a particular edge.
+    It is the index of the directed loop the strand enters the edge along (prev_loop, facing as before
+    crossing to loop), which visit_strands enters only once, so lies in range(2 * get_loop_count(bm))."""
+    return 2 * prev_loop.index + ((loop.vert.index == prev_loop.vert.index) == forward)
 
 
 class StrandAnalysisBuilder:
     """Computes information about which strand parts belong to which strands."""
-    def __init__(self):
+    def __init__(self, bm):
         self.crossings = defaultdict(list)
         self.current_strand_index = 0
-        self.strand_indices = {}
-        self.strand_size = defaultdict(int)
+        self.strand_indices = array("i", [-1]) * (2 * get_loop_count(bm))
+        self.strand_positions = array("i", [-1]) * (2 * get_loop_count(bm))
+        self.strand_size = array("i")
 
     # Builder methods
     def start_strand(self):
-        pass
+        self.strand_size.append(0)
 
     def add_loop(self, prev_loop, loop, twist, forward):
         if twist != STRAIGHT:
             self.crossings[loop.edge.index].append(self.current_strand_index)
-        self.strand_indices[strand_part(prev_loop, loop, forward)] = self.current_strand_index
+        sp = strand_part(prev_loop, loop, forward)
+        self.strand_indices[sp] = self.current_strand_index
+        self.strand_positions[sp] = self.strand_size[self.current_strand_index]
         self.strand_size[self.current_strand_index] += 1
 
-    def end_strand(self):
+    def end_strand(self, cyclic=True):
         self.current_strand_index += 1
 
-    def all_crossings(self):
-        return set(frozenset([x, y]) for l in self.crossings.values() for x in l for y in l if x != y)
-
     def get_strands(self):
-        """Returns a dict of strand parts to integers"""
-        return self.strand_indices
+        """Returns an array of the strand index of each strand part, or -1 for unused parts"""
+        return np.frombuffer(self.strand_indices, dtype=np.intc)
+
+    def get_strand_positions(self):
+        """Returns an array of the index of each strand part within its strand, or -1 for unused parts"""
+        return np.frombuffer(self.strand_positions, dtype=np.intc)
 
     def get_strand_sizes(self):
-        return self.strand_size
+        """Returns an array of the number of parts in each strand"""
+        return np.frombuffer(self.strand_size, dtype=np.intc)
 
     def get_braids(self):
         """Partitions the strands so any two crossing strands are in separate partitions.
         Each partition is called a braid.
-        Returns a dict of strand parts to integers"""
-        crossings = self.all_crossings()
-        braids = defaultdict(list)
-        braid_count = 0
+        Returns an array of the braid index of each strand part, or -1 for unused parts"""
+        crossed_strands = defaultdict(set)
+        for strands in self.crossings.values():
+            for x in strands:
+                crossed_strands[x].update(strands)
+        strand_braids = np.zeros(self.current_strand_index, dtype=np.intc)
         for s in range(self.current_strand_index):
-            crossed_braids = set(braids[t] for p in crossings if s in p for t in p if t in braids)
-            for b in range(braid_count):
-                if b not in crossed_braids:
-                    break
-            else:
-                b = braid_count
-                braid_count += 1
-            braids[s] = b
-        return {k: braids[v] for (k, v) in self.strand_indices.items()}
+            crossed_braids = set(strand_braids[t] for t in crossed_strands[s] if t < s)
+            b = 0
+            while b in crossed_braids:
+                b += 1
+            strand_braids[s] = b
+        strands = self.get_strands()
+        if self.current_strand_index == 0:
+            # Every part is unused
+            return np.full_like(strands, -1)
+        return np.where(strands >= 0, strand_braids[strands], -1).astype(np.intc)
 
 
 def get_medial_twill_twists(bm, orig_face_len):
     """Gets twists per edge assuming bm has been transformed by remesh_medial."""
-    twists = [TWIST_CW] * len(bm.edges)
+    twists = np.full(len(bm.edges), TWIST_CW, dtype=np.uint8)
     for face in bm.faces[0:orig_face_len]:
         for edge in face.edges:
             twists[edge.index] = TWIST_CCW
     return twists
 
 
-def get_twill_twists(bm):
-    """Gets twists per edge that describe a pattern where each strand goes over 2 then under 2,
-    and adjacent strands have the pattern offset by one.
-    This is heuristic, it's not always possible for some meshes.
-    Largely based off "Cyclic Twill-Woven Objects", Akleman, Chen, Chen, Xing, Gross (2011)
-    """
-    seed(0)
-    bm.verts.ensure_lookup_table()
-    bm.edges.ensure_lookup_table()
-
+def get_twill_conditions(bm, coloring):
+    """Returns functions for the conditions get_twill_twists tries to meet around each edge:
+    count_votes(edge_index), the votes of the conditions for each twist of the edge,
+    and count_violations(edge_index), the number of conditions voting against its current twist.
+    They read the twists from the bytearray coloring, which may change between calls."""
     def move(d):
         return d.next_face_loop.next_edge_loop
 
@@ -320,13 +572,13 @@ def get_twill_twists(bm):
         next2 = move(next)
         twist1 = coloring[next.loop.edge.index]
         twist2 = coloring[next2.loop.edge.index]
-        if twist1 is None or twist2 is None:
+        if twist1 == UNASSIGNED or twist2 == UNASSIGNED:
             return Votes()
-        if twist1 is TWIST_CW and twist2 is TWIST_CW:
+        if twist1 == TWIST_CW and twist2 == TWIST_CW:
             return Votes(0, 1)
-        if twist1 is TWIST_CCW and twist2 is TWIST_CCW:
+        if twist1 == TWIST_CCW and twist2 == TWIST_CCW:
             return Votes(1, 0)
-        if twist1 is TWIST_CW:
+        if twist1 == TWIST_CW:
             return Votes(1, 0)
         else:
             return Votes(0, 1)
@@ -338,10 +590,10 @@ def get_twill_twists(bm):
         twist_s = coloring[s.loop.edge.index]
         twist_p = coloring[p.loop.edge.index]
         twist_f = coloring[f.loop.edge.index]
-        if twist_s is None or twist_p is None or twist_f is None:
+        if twist_s == UNASSIGNED or twist_p == UNASSIGNED or twist_f == UNASSIGNED:
             return Votes()
         if twist_p != twist_f:
-            if twist_s is TWIST_CW:
+            if twist_s == TWIST_CW:
                 return Votes(1, 0)
             else:
                 return Votes(0, 1)
@@ -354,10 +606,10 @@ def get_twill_twists(bm):
         twist_s = coloring[s.loop.edge.index]
         twist_p = coloring[p.loop.edge.index]
         twist_f = coloring[f.loop.edge.index]
-        if twist_s is None or twist_p is None or twist_f is None:
+        if twist_s == UNASSIGNED or twist_p == UNASSIGNED or twist_f == UNASSIGNED:
             return Votes()
         if twist_p != twist_f:
-            if twist_s is TWIST_CW:
+            if twist_s == TWIST_CW:
                 return Votes(1, 0)
             else:
                 return Votes(0, 1)
@@ -379,10 +631,70 @@ def get_twill_twists(bm):
 
         return votes
 
+    def count_violations(edge_index):
+        """Counts the conditions around an edge that vote against its current twist."""
+        twist = coloring[edge_index]
+        # The first edge of each island is colored even if it is on the boundary, or a wire edge
+        loops = bm.edges[edge_index].link_loops
+        if twist not in (TWIST_CW, TWIST_CCW) or not loops or is_boundary(loops[0]):
+            return 0
+        violations = 0
+        for loop in loops:
+            for forward in (True, False):
+                dloop = DirectedLoop(loop, forward)
+                for votes in (edge_cond_vote(dloop), face_cond_vote(dloop), vert_cond_vote(dloop)):
+                    if twist == TWIST_CW and votes.ccw > votes.cw or twist == TWIST_CCW and votes.cw > votes.ccw:
+                        violations += 1
+        return violations
+
+    return count_votes, count_violations
+
+
+def count_twill_violations(bm, twists):
+    """Counts the conditions of get_twill_twists that vote against the twists of their edges, over the whole mesh."""
+    bm.edges.ensure_lookup_table()
+    coloring = bytearray(np.asarray(twists, dtype=np.uint8).tobytes())
+    count_violations = get_twill_conditions(bm, coloring)[1]
+    return sum(count_violations(e) for e in range(len(coloring)))
+
+
+def get_twill_twists(bm, refine_iterations=0, refine_time=0, initial=None):
+    """Gets twists per edge that describe a pattern where each strand goes over 2 then under 2,
+    and adjacent strands have the pattern offset by one.
+    This is heuristic, it's not always possible for some meshes.
+    Largely based off "Cyclic Twill-Woven Objects", Akleman, Chen, Chen, Xing, Gross (2011)
+    If refine_iterations is set, the result is then improved by flipping single edges
+    that reduce the number of violated conditions, stopping after that many attempts
+    or refine_time seconds (if non-zero).
+    If initial is given, its twists are kept, and only UNASSIGNED edges are solved,
+    growing out from the kept ones.
+    """
+    seed(0)
+    bm.verts.ensure_lookup_table()
+    bm.edges.ensure_lookup_table()
+
+    def nearby_edges(edge):
+        """Returns the edges whose votes may depend on the twist of edge."""
+        nearby = set()
+        for v1 in edge.verts:
+            for e2 in v1.link_edges:
+                for v2 in e2.verts:
+                    if v1.index == v2.index: continue
+                    for e3 in v2.link_edges:
+                        nearby.add(e3.index)
+        return nearby
+
     # Initialize
     frontier = set()
-    coloring = [None] * len(bm.edges)
+    coloring = bytearray(len(bm.edges))
+    count_votes, count_violations = get_twill_conditions(bm, coloring)
     cached_votes = {}
+    if initial is not None:
+        coloring[:] = np.asarray(initial, dtype=np.uint8).tobytes()
+        for e in np.flatnonzero(np.asarray(initial) == UNASSIGNED):
+            for v in bm.edges[e].verts:
+                if any(coloring[other.index] != UNASSIGNED for other in v.link_edges):
+                    frontier.add(int(e))
 
     def color_edge(edge, twist):
         if edge.index in frontier:
@@ -390,16 +702,12 @@ def get_twill_twists(bm):
         coloring[edge.index] = twist
         for v in edge.verts:
             for other in v.link_edges:
-                if coloring[other.index] is None:
+                if coloring[other.index] == UNASSIGNED:
                     frontier.add(other.index)
         # Clear cached votes
         cached_votes.pop(edge.index, None)
-        for v1 in edge.verts:
-            for e2 in v1.link_edges:
-                for v2 in e2.verts:
-                    if v1.index == v2.index: continue
-                    for e3 in v2.link_edges:
-                        cached_votes.pop(e3.index, None)
+        for e in nearby_edges(edge):
+            cached_votes.pop(e, None)
 
     def get_cached_vote(edge_index):
         if edge_index in cached_votes:
@@ -407,32 +715,21 @@ def get_twill_twists(bm):
         else:
             return cached_votes.setdefault(edge_index, count_votes(edge_index))
 
-    # For each disconnected island of edges
-    while True:
-        uncolored = [i for i, color in enumerate(coloring) if color is None]
-        if not uncolored:
-            break
-
-        # Pick a random point
-        v0 = choice(bm.edges[choice(uncolored)].verts)
-
-        # Set initial coloring
-        for e in v0.link_edges:
-            color_edge(e, TWIST_CW)
-            break
-
-        # Explore from frontier
+    def explore():
+        """Colors edges from the frontier outwards, until it is empty."""
         while frontier:
-            # First clear out any boundaries from the frontier
+            # First clear out any boundaries (and wire edges) from the frontier
             while True:
                 found_boundaries = False
                 for e in list(frontier):
                     edge = bm.edges[e]
-                    if is_boundary(edge.link_loops[0]):
+                    if not edge.link_loops or is_boundary(edge.link_loops[0]):
                         color_edge(edge, IGNORE)
                         found_boundaries = True
                 if not found_boundaries:
                     break
+            if not frontier:
+                break
             # Color the best choice of edge
             votes = {e: get_cached_vote(e) for e in frontier}
             m = max(max(v.cw, v.ccw) for v in votes.values())
@@ -440,27 +737,80 @@ def get_twill_twists(bm):
             set_twist = TWIST_CW if best_votes.cw > best_votes.ccw else TWIST_CCW
             color_edge(bm.edges[best_edge], set_twist)
 
+    # Continue from any initial twists
+    explore()
+
+    # For each disconnected island of edges
+    while True:
+        uncolored = [i for i, color in enumerate(coloring) if color == UNASSIGNED]
+        if not uncolored:
+            break
+
+        # Pick a random point
+        v0 = choice(bm.edges[choice(uncolored)].verts)
+
+        # Set initial coloring
+        for e in v0.link_edges:
+            color_edge(e, TWIST_CW)
+            break
+
+        explore()
+
     assert all(coloring), "Failed to assign some twists when computing twill"
 
-    return coloring
+    # Local search, keeping a count of violations per edge so that
+    # each flip only needs to recount its neighbourhood
+    if refine_iterations > 0:
+        deadline = perf_counter() + refine_time if refine_time > 0 else None
+        violations = [count_violations(e) for e in range(len(coloring))]
+        queued = bytearray(v > 0 for v in violations)
+        queue = [e for e, v in enumerate(violations) if v > 0]
+        for iteration in range(refine_iterations):
+            if not queue or (deadline is not None and perf_counter() > deadline):
+                break
+            # Pop a random queued edge
+            i = randrange(len(queue))
+            queue[i], queue[-1] = queue[-1], queue[i]
+            e = queue.pop()
+            queued[e] = False
+            if violations[e] == 0:
+                continue
+            nearby = nearby_edges(bm.edges[e])
+            before = sum(violations[n] for n in nearby)
+            coloring[e] = TWIST_CCW if coloring[e] == TWIST_CW else TWIST_CW
+            after = {n: count_violations(n) for n in nearby}
+            if sum(after.values()) < before:
+                for n, v in after.items():
+                    violations[n] = v
+                    if v > 0 and not queued[n]:
+                        queued[n] = True
+                        queue.append(n)
+            else:
+                coloring[e] = TWIST_CCW if coloring[e] == TWIST_CW else TWIST_CW
+
+    return np.frombuffer(coloring, dtype=np.uint8)
 
 
 def get_offset(weave_up, weave_down, twist, forward):
-    if twist is TWIST_CW:
+    if twist == TWIST_CW:
         return weave_down if forward else weave_up
-    elif twist is TWIST_CCW:
+    elif twist == TWIST_CCW:
         return weave_up if forward else weave_down
-    elif twist is STRAIGHT:
+    elif twist == STRAIGHT:
         return (weave_down + weave_up) / 2.0
     else:
-        assert False, "Unexpected twist type " + twist
+        assert False, "Unexpected twist type " + str(twist)
 
 
 class RibbonBuilder:
-    """Builds a mesh containing a polygonal ribbon for each strand."""
+    """Builds a mesh containing a polygonal ribbon for each strand.
+    If shared_ends is set, strands that are not cyclic end on a part that starts another strand
+    (like the runs of get_tile_runs), so they only join up to it, leaving the rest of it to the other strand.
+    Uvs and vertex params follow the position of each part in its whole strand, so runs match up."""
     def __init__(self, weave_up, weave_down, length, breadth,
                  strand_analysis=None,
-                 materials=None):
+                 materials=None,
+                 shared_ends=False):
         self.weave_up = weave_up
         self.weave_down = weave_down
         self.vertices = []
@@ -470,13 +820,17 @@ class RibbonBuilder:
         self.first_in_verts = None
         self.first_in_uvs = None
         self.prev_material = None
+        self.prev_part = None
         self.c = length
         self.w = breadth
         self.strand_analysis = strand_analysis
         self.uvs = []
-        self.materials = materials or defaultdict(int)
+        self.materials = materials
         self.material_values = []
-        self.count = 0
+        self.face_parts = array("i")
+        self.vertex_params = array("f")
+        self.shared_ends = shared_ends
+        self.pending_part = None
 
     def get_sub_face(self, v1, v2, v3, v4):
         hc = self.c / 2.0
@@ -494,15 +848,30 @@ class RibbonBuilder:
         self.prev_out_verts = None
         self.prev_out_uvs = None
         self.prev_material = None
-        self.count = 0
+        self.prev_part = None
+        self.pending_part = None
 
     def add_vertex(self, vert_co):
         self.vertices.append(vert_co)
 
-    def add_face(self, vertices, uvs, material):
+    def add_face(self, vertices, uvs, material, part):
         self.faces.append(vertices)
         self.uvs.extend(uvs)
         self.material_values.append(material)
+        self.face_parts.append(part)
+
+    def add_pending_part(self):
+        """Adds the out vertices and faces of the last part, which are left out
+        if it ends a strand with shared_ends (as it then belongs to another strand)."""
+        if self.pending_part is None:
+            return
+        vertices, params, faces = self.pending_part
+        for vert_co in vertices:
+            self.add_vertex(vert_co)
+        self.vertex_params.extend(params)
+        for face in faces:
+            self.add_face(*face)
+        self.pending_part = None
 
     def add_loop(self, prev_loop, loop, twist, forward):
         normal = loop.calc_normal() + prev_loop.calc_normal()
@@ -514,7 +883,7 @@ class RibbonBuilder:
         v1 = loop.vert.co
         v2 = loop.link_loop_next.vert.co
 
-        if twist is STRAIGHT:
+        if twist == STRAIGHT:
             if forward:
                 v1, center1, v2, center2 = center1, v1, v2, center1
             else:
@@ -525,27 +894,36 @@ class RibbonBuilder:
 
         v1, center1, v2, center2 = self.get_sub_face(v1, center1, v2, center2)
 
-        sp = strand_part(prev_loop, loop, forward)
-        self.prev_material = material = self.materials[sp]
+        self.prev_part = sp = strand_part(prev_loop, loop, forward)
+        self.prev_material = material = 0 if self.materials is None else int(self.materials[sp])
 
         if self.strand_analysis:
+            # Positions within the whole strand, so that runs of it (like tiles) match up
             strand_index = self.strand_analysis.get_strands()[sp]
             strand_size = self.strand_analysis.get_strand_sizes()[strand_index]
-            u1 = (self.count + 0) / strand_size
-            u2 = (self.count + self.c) / strand_size
+            position = self.strand_analysis.get_strand_positions()[sp]
+            u1 = (position + 0) / strand_size
+            u2 = (position + self.c) / strand_size
+            # A run continuing past the end of its strand wraps the uvs around, like end_strand does
+            wrap = 1 if position == 0 else 0
         else:
             u1 = None
             u2 = None
+            wrap = 0
 
+        # The out vertices and faces of each part are added once the next part is,
+        # in case it ends a strand with shared_ends
+        self.add_pending_part()
         i = len(self.vertices)
         self.add_vertex(v1 + offset)
         self.add_vertex(center1 + offset)
-        self.add_vertex(v2 + offset)
-        self.add_vertex(center2 + offset)
-        self.add_face([i, i + 1, i + 2], [u1, 0, u1, 1, u2, 1], material)
-        self.add_face([i, i + 2, i + 3], [u1, 0, u2, 1, u2, 0], material)
+        if u1 is not None:
+            self.vertex_params.extend((u1, u1))
+        self.pending_part = ([v2 + offset, center2 + offset],
+                             [] if u2 is None else [u2, u2],
+                             [([i, i + 1, i + 2], [u1, 0, u1, 1, u2, 1], material, sp),
+                              ([i, i + 2, i + 3], [u1, 0, u2, 1, u2, 0], material, sp)])
         in_verts = [i + 1, i + 0]
-        in_uvs = [u1, 1, u1, 0]
         out_verts = [i + 3, i + 2]
         out_uvs = [u2, 0, u2, 1]
 
@@ -554,19 +932,26 @@ class RibbonBuilder:
             self.first_in_uvs = [u1 + 1, 1, u1 + 1, 0]
         if self.prev_out_verts is not None:
             self.add_face(self.prev_out_verts + in_verts,
-                          self.prev_out_uvs + in_uvs,
-                          material)
+                          self.prev_out_uvs + [u1 + wrap, 1, u1 + wrap, 0],
+                          material, sp)
         self.prev_out_verts = out_verts
         self.prev_out_uvs = out_uvs
-        self.count += 1
 
-    def end_strand(self):
-        self.add_face(self.prev_out_verts + self.first_in_verts,
-                      self.prev_out_uvs + self.first_in_uvs,
-                      self.prev_material)
-
-    def make_mesh(self):
-        me = bpy.data.meshes.new("")
+    def end_strand(self, cyclic=True):
+        if cyclic or not self.shared_ends:
+            self.add_pending_part()
+        self.pending_part = None
+        if cyclic:
+            self.add_face(self.prev_out_verts + self.first_in_verts,
+                          self.prev_out_uvs + self.first_in_uvs,
+                          self.prev_material, self.prev_part)
+
+    def make_mesh(self, me=None):
+        """Creates a mesh from the built data, or overwrites the geometry of me if given."""
+        if me is None:
+            me = bpy.data.meshes.new("")
+        else:
+            me.clear_geometry()
         # Create mesh
         me.from_pydata(self.vertices, [], self.faces)
         # Set materials
@@ -578,10 +963,33 @@ class RibbonBuilder:
         me.update(calc_edges=True)
         return me
 
+    def store_attributes(self, me):
+        """Writes the strand and braid of each face, and the position along the strand
+        of each vertex, as attributes of the mesh made by make_mesh."""
+        face_parts = np.frombuffer(self.face_parts, dtype=np.intc)
+        store_ribbon_attributes(me,
+                                self.strand_analysis.get_strands()[face_parts],
+                                self.strand_analysis.get_braids()[face_parts],
+                                np.frombuffer(self.vertex_params, dtype=np.float32))
+
+
+def store_ribbon_attributes(me, strands, braids, vertex_params):
+    """Writes attributes for attribute coloring, replacing any from previous runs."""
+    for name in (STRAND_ATTRIBUTE, BRAID_ATTRIBUTE, PARAM_ATTRIBUTE):
+        if name in me.attributes:
+            me.attributes.remove(me.attributes[name])
+    me.attributes.new(STRAND_ATTRIBUTE, "INT", "FACE").data.foreach_set("value", strands)
+    me.attributes.new(BRAID_ATTRIBUTE, "INT", "FACE").data.foreach_set("value", braids)
+    me.attributes.new(PARAM_ATTRIBUTE, "FLOAT", "POINT").data.foreach_set("value", vertex_params)
+
 
 class BezierBuilder:
-    """Builds a bezier object containing a curve for each strand."""
-    def __init__(self, bm, crossing_angle, crossing_strength, handle_type, weave_up, weave_down, materials=None):
+    """Builds a bezier object containing a curve for each strand.
+    If curve is given, it is overwritten instead of creating a new one,
+    or just added to if keep_splines is set.
+    midpoints are from get_edge_midpoints (or an EdgeMidpoints), computed if not given."""
+    def __init__(self, bm, crossing_angle, crossing_strength, handle_type, weave_up, weave_down, materials=None,
+                 curve=None, keep_splines=False, midpoints=None):
         # Cache some values
         self.s = sin(crossing_angle) * crossing_strength
         self.c = cos(crossing_angle) * crossing_strength
@@ -589,21 +997,15 @@ class BezierBuilder:
         self.weave_up = weave_up
         self.weave_down = weave_down
         # Create the new object
-        self.curve = bpy.data.curves.new("Celtic", "CURVE")
-        self.curve.dimensions = "3D"
-        self.curve.twist_mode = "MINIMUM"
-        setup_materials(self.curve.materials, materials)
-        # Compute all the midpoints of each edge
-        self.midpoints = []
-        for e in bm.edges:
-            self.midpoints.append(edge_midpoint(e))
+        self.curve = curve if keep_splines else new_knot_curve(materials, curve)
+        self.midpoints = get_edge_midpoints(bm) if midpoints is None else midpoints
         # Per strand stuff
         self.current_spline = None
         self.cos = None
         self.handle_lefts = None
         self.handle_rights = None
         self.first = True
-        self.materials = materials or defaultdict(int)
+        self.materials = materials
         self.current_material = None
 
     def start_strand(self):
@@ -629,7 +1031,10 @@ class BezierBuilder:
         midpoint = midpoint + offset
         self.cos.extend(midpoint)
 
-        self.current_material = self.materials[strand_part(prev_loop, loop, forward)]
+        if self.materials is not None:
+            self.current_material = int(self.materials[strand_part(prev_loop, loop, forward)])
+        else:
+            self.current_material = 0
 
         if self.handle_type != "AUTO":
             tangent = loop.link_loop_next.vert.co - loop.vert.co
@@ -643,7 +1048,8 @@ class BezierBuilder:
             self.handle_lefts.extend(handle_left)
             self.handle_rights.extend(handle_right)
 
-    def end_strand(self):
+    def end_strand(self, cyclic=True):
+        self.current_spline.use_cyclic_u = cyclic
         points = self.current_spline.bezier_points
         points.foreach_set("co", self.cos)
         self.current_spline.material_index = self.current_material
@@ -652,9 +1058,11 @@ class BezierBuilder:
             points.foreach_set("handle_right", self.handle_rights)
 
 
-def visit_strands(bm, twists, builder):
+def visit_strands(bm, twists, builder, start_loops=None):
     """Walks over a mesh strand by strand turning at each edge by the specified twists,
-    calling visitor methods on the given builder for each edge crossed."""
+    calling visitor methods on the given builder for each edge crossed.
+    If start_loops is given, only the strands through those loops are visited."""
+    twists = twist_view(twists)
     # Stores which loops the curve has already passed through
     loops_entered = defaultdict(lambda: False)
     loops_exited = defaultdict(lambda: False)
@@ -693,11 +1101,486 @@ def visit_strands(bm, twists, builder):
         builder.end_strand()
 
     # Attempt to start a loop at each untouched loop in the entire mesh
+    if start_loops is None:
+        start_loops = (loop for face in bm.faces for loop in face.loops)
+    for loop in start_loops:
+        if is_boundary(loop): continue
+        if not loops_exited[loop]: make_loop(DirectedLoop(loop, True))
+        if not loops_entered[loop]: make_loop(DirectedLoop(loop, False))
+
+
+class StrandTableBuilder:
+    """Records the strand parts visited as compact arrays of loop indices,
+    so that they can be replayed into other builders later."""
+    def __init__(self):
+        self.prev_loops = array("i")
+        self.loops = array("i")
+        self.forwards = array("b")
+        self.strand_starts = array("i")
+
+    # Builder methods
+    def start_strand(self):
+        self.strand_starts.append(len(self.loops))
+
+    def add_loop(self, prev_loop, loop, twist, forward):
+        self.prev_loops.append(prev_loop.index)
+        self.loops.append(loop.index)
+        self.forwards.append(forward)
+
+    def end_strand(self, cyclic=True):
+        pass
+
+    def strand_ranges(self):
+        """Yields the (start, end) part indices of each strand"""
+        ends = self.strand_starts[1:] + array("i", [len(self.loops)])
+        return zip(self.strand_starts, ends)
+
+    def strand_runs(self):
+        """Returns every strand as a cyclic run, for visit_strand_runs"""
+        return [(range(start, end), True) for start, end in self.strand_ranges()]
+
+
+def get_loop_count(bm):
+    return sum(len(face.loops) for face in bm.faces)
+
+
+def get_loop_lookup(bm):
+    """Returns a list of every loop in the mesh, ordered by loop index."""
+    lookup = [None] * get_loop_count(bm)
     for face in bm.faces:
         for loop in face.loops:
-            if is_boundary(loop): continue
-            if not loops_exited[loop]: make_loop(DirectedLoop(loop, True))
-            if not loops_entered[loop]: make_loop(DirectedLoop(loop, False))
+            lookup[loop.index] = loop
+    return lookup
+
+
+def get_face_tiles(bm, tile_size):
+    """Assigns each face to a cell of a regular grid, based on the face center."""
+    return [tuple(floor(c / tile_size) for c in face.calc_center_median()) for face in bm.faces]
+
+
+def get_tile_runs(table, loop_lookup, face_tiles):
+    """Splits the strands of a StrandTableBuilder into runs of parts per tile.
+    A strand part lies on an edge, so runs in adjacent tiles share their end parts,
+    which stitches them together seamlessly (see RibbonBuilder's shared_ends).
+    Returns a dict of tile to lists of (part indices, cyclic)"""
+    runs = defaultdict(list)
+    for start, end in table.strand_ranges():
+        # Tile of the face crossed after each part
+        tiles = [face_tiles[loop_lookup[table.loops[i]].face.index] for i in range(start, end)]
+        n = len(tiles)
+        if all(tile == tiles[0] for tile in tiles):
+            runs[tiles[0]].append((list(range(start, end)), True))
+            continue
+        # Rotate so we begin at a tile boundary
+        first = next(i for i in range(n) if tiles[i] != tiles[i - 1])
+        i = first
+        while True:
+            tile = tiles[i]
+            parts = [start + i]
+            while True:
+                i = (i + 1) % n
+                parts.append(start + i)
+                if tiles[i] != tile:
+                    break
+            runs[tile].append((parts, False))
+            if i == first:
+                break
+    return runs
+
+
+def visit_strand_runs(bm, twists, builder, table, runs, loop_lookup):
+    """Replays runs of strand parts recorded by a StrandTableBuilder,
+    calling visitor methods on the given builder in the same way as visit_strands."""
+    twists = twist_view(twists)
+    for parts, cyclic in runs:
+        builder.start_strand()
+        for i in parts:
+            loop = loop_lookup[table.loops[i]]
+            builder.add_loop(loop_lookup[table.prev_loops[i]], loop,
+                             twists[loop.edge.index], bool(table.forwards[i]))
+        builder.end_strand(cyclic)
+
+
+## Strand tracing with arrays (finding every strand at once, for large meshes)
+
+class LoopLinks:
+    """Arrays of the neighbours of every loop, indexed by loop index.
+    Loops without radial neighbours (on the boundary) have -1 instead."""
+    def __init__(self, bm):
+        face_order = []
+        verts = []
+        edges = []
+        next_loops = []
+        prev_loops = []
+        radial_next = []
+        radial_prev = []
+        self.max_face_size = 0
+        for face in bm.faces:
+            self.max_face_size = max(self.max_face_size, len(face.loops))
+            for loop in face.loops:
+                face_order.append(loop.index)
+                verts.append(loop.vert.index)
+                edges.append(loop.edge.index)
+                next_loops.append(loop.link_loop_next.index)
+                prev_loops.append(loop.link_loop_prev.index)
+                radial = loop.link_loops
+                radial_next.append(radial[0].index if radial else -1)
+                radial_prev.append(radial[-1].index if radial else -1)
+        # Everything else is ordered by loop index
+        self.face_order = np.array(face_order, dtype=np.intc)
+        inverse = np.empty_like(self.face_order)
+        inverse[self.face_order] = np.arange(len(face_order), dtype=np.intc)
+        self.face_positions = inverse
+        self.verts = np.array(verts, dtype=np.intc)[inverse]
+        self.edges = np.array(edges, dtype=np.intc)[inverse]
+        self.next_loops = np.array(next_loops, dtype=np.intc)[inverse]
+        self.prev_loops = np.array(prev_loops, dtype=np.intc)[inverse]
+        self.radial_next = np.array(radial_next, dtype=np.intc)[inverse]
+        self.radial_prev = np.array(radial_prev, dtype=np.intc)[inverse]
+
+
+def skip_boundary_loops(steps, boundary, max_face_size):
+    """Vectorized equivalent of DirectedLoop.next_face_loop for every loop,
+    where steps is the next or previous loop in the face.
+    Loops of faces that are entirely boundary get -1."""
+    result = steps.copy()
+    todo = np.flatnonzero(boundary[result])
+    for _ in range(max_face_size):
+        if len(todo) == 0:
+            return result
+        result[todo] = steps[result[todo]]
+        todo = todo[boundary[result[todo]]]
+    result[todo] = -1
+    return result
+
+
+def get_cycle_labels(succ):
+    """Labels every element of a permutation with the smallest element of its cycle.
+    Uses pointer jumping, so takes a logarithmic number of passes over the array."""
+    labels = np.arange(len(succ))
+    jumps = succ
+    while True:
+        labels = np.minimum(labels, labels[jumps])
+        # Constant labels along every cycle means each is its cycle's minimum
+        if (labels == labels[succ]).all():
+            return labels
+        jumps = jumps[jumps]
+
+
+def get_list_ranks(prev):
+    """Finds the distance of every element from the root of its list,
+    where prev points towards the root, and roots point to themselves."""
+    prev = prev.copy()
+    ranks = (prev != np.arange(len(prev))).astype(np.intp)
+    while True:
+        prev_prev = prev[prev]
+        if (prev_prev == prev).all():
+            return ranks
+        ranks += ranks[prev]
+        prev = prev_prev
+
+
+def get_strand_table(bm, twists):
+    """Finds the same strands as visit_strands(bm, twists, table) with a StrandTableBuilder, in the same order,
+    but using whole array operations rather than walking the strands one part at a time.
+
+    Each step of visit_strands moves from one directed loop to the next, regardless of the strand it is on,
+    so strands are the cycles of a permutation of directed loops, which can be labelled by pointer jumping.
+    Every strand is also found in reverse, as a mirror cycle. visit_strands traces whichever of the pair
+    includes the earliest directed loop it tries, starting from that loop.
+    Edges with more than two faces can make several directed loops step to the same one,
+    so such meshes fall back to visit_strands."""
+    links = LoopLinks(bm)
+    twists = np.asarray(twists)
+    loop_count = len(links.verts)
+    state_count = 2 * loop_count
+    # Directed loops are numbered like strand_part
+    states = np.arange(state_count)
+    forwards = (states & 1).astype(bool)
+    boundary = links.radial_next < 0
+    # The loop moved to within the face, by DirectedLoop.next_face_loop
+    mids = np.empty(state_count, dtype=np.intc)
+    mids[0::2] = skip_boundary_loops(links.prev_loops, boundary, links.max_face_size)
+    mids[1::2] = skip_boundary_loops(links.next_loops, boundary, links.max_face_size)
+    valid = ~np.repeat(boundary, 2) & (mids >= 0)
+    mids[~valid] = 0
+    # Then across the edge, by DirectedLoop.next_edge_loop
+    mid_twists = twists[links.edges[mids]]
+    crossing = valid & ((mid_twists == TWIST_CW) | (mid_twists == TWIST_CCW))
+    radial = np.where(forwards, links.radial_next[mids], links.radial_prev[mids])
+    radial[~crossing] = 0
+    next_loops = np.where(crossing, radial, mids)
+    next_forwards = np.where(crossing, (links.verts[radial] == links.verts[mids]) == forwards, forwards)
+    succ = np.where(valid, 2 * next_loops + next_forwards, states)
+    # Walking a strand backwards visits these directed loops, in reverse order
+    mirrors = np.where(valid, 2 * mids + ~forwards, states)
+    valid_states = states[valid]
+    if (np.bincount(succ[valid_states], minlength=state_count)[valid_states] != 1).any() or \
+            (succ[mirrors[succ[valid_states]]] != mirrors[valid_states]).any():
+        table = StrandTableBuilder()
+        visit_strands(bm, twists, table)
+        return table
+
+    # Find the order visit_strands tries directed loops in, then the first tried of each pair of cycles
+    labels = get_cycle_labels(succ)
+    pairs = np.minimum(labels, labels[mirrors])
+    ranks = 2 * links.face_positions[states >> 1] + ~forwards
+    ranked_states = np.empty_like(states)
+    ranked_states[ranks] = states
+    first_ranks = np.full(state_count, state_count)
+    np.minimum.at(first_ranks, pairs[valid], ranks[valid])
+    starts = ranked_states[np.minimum(first_ranks[pairs], state_count - 1)]
+    traced = valid & (labels == labels[starts])
+
+    # Order the parts of each strand from its start
+    prev = np.empty_like(states)
+    prev[succ] = states
+    prev[~traced | (states == starts)] = states[~traced | (states == starts)]
+    counts = get_list_ranks(prev)
+    traced_states = np.flatnonzero(traced)
+    order = traced_states[np.lexsort((counts[traced_states], first_ranks[pairs[traced_states]]))]
+
+    table = StrandTableBuilder()
+    table.prev_loops.frombytes(mids[order].astype(np.intc).tobytes())
+    table.loops.frombytes((succ[order] >> 1).astype(np.intc).tobytes())
+    table.forwards.frombytes((succ[order] & 1).astype(np.int8).tobytes())
+    table.strand_starts.frombytes(np.flatnonzero(counts[order] == 0).astype(np.intc).tobytes())
+    return table
+
+
+## Vectorized geometry (recomputing strand positions from arrays of vertex positions)
+
+class MeshTopology:
+    """Arrays describing the connectivity of a mesh, indexed by loop index."""
+    def __init__(self, bm):
+        loop_count = get_loop_count(bm)
+        self.vert_count = len(bm.verts)
+        self.edge_verts = get_edge_verts(bm)
+        self.loop_verts = np.empty(loop_count, dtype=np.intc)
+        self.loop_next_verts = np.empty(loop_count, dtype=np.intc)
+        self.loop_prev_verts = np.empty(loop_count, dtype=np.intc)
+        self.loop_edges = np.empty(loop_count, dtype=np.intc)
+        self.loop_faces = np.empty(loop_count, dtype=np.intc)
+        # Loop indices grouped by face, for per face sums
+        self.face_loops = np.empty(loop_count, dtype=np.intc)
+        self.face_starts = np.empty(len(bm.faces), dtype=np.intc)
+        self.face_sizes = np.empty(len(bm.faces), dtype=np.intc)
+        i = 0
+        for face in bm.faces:
+            self.face_starts[face.index] = i
+            self.face_sizes[face.index] = len(face.loops)
+            for loop in face.loops:
+                self.loop_verts[loop.index] = loop.vert.index
+                self.loop_next_verts[loop.index] = loop.link_loop_next.vert.index
+                self.loop_prev_verts[loop.index] = loop.link_loop_prev.vert.index
+                self.loop_edges[loop.index] = loop.edge.index
+                self.loop_faces[loop.index] = face.index
+                self.face_loops[i] = loop.index
+                i += 1
+
+
+def normalized(vectors):
+    """Normalizes an array of vectors, leaving zero vectors unchanged."""
+    lengths = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(lengths > 0, lengths, 1)
+
+
+def get_face_centers(co, topology):
+    """Vectorized equivalent of face.calc_center_median() for every face."""
+    sums = np.add.reduceat(co[topology.loop_verts[topology.face_loops]], topology.face_starts, axis=0)
+    return sums / topology.face_sizes[:, None]
+
+
+def get_loop_normals(co, topology):
+    """Vectorized equivalent of loop.calc_normal() for every loop.
+    Falls back to the face normal for straight corners."""
+    v = co[topology.loop_verts]
+    normals = np.cross(co[topology.loop_next_verts] - v, co[topology.loop_prev_verts] - v)
+    lengths = np.linalg.norm(normals, axis=1)
+    straight = lengths < 1e-12
+    if straight.any():
+        # Newell's method
+        face_loop_verts = topology.loop_verts[topology.face_loops]
+        face_loop_next_verts = topology.loop_next_verts[topology.face_loops]
+        face_normals = normalized(np.add.reduceat(np.cross(co[face_loop_verts], co[face_loop_next_verts]),
+                                                  topology.face_starts, axis=0))
+        normals[straight] = face_normals[topology.loop_faces[straight]]
+        lengths[straight] = 1
+    return normals / np.where(lengths > 0, lengths, 1)[:, None]
+
+
+def get_offsets(weave_up, weave_down, twists, forwards):
+    """Vectorized equivalent of get_offset."""
+    return np.where(twists == STRAIGHT, (weave_down + weave_up) / 2.0,
+                    np.where((twists == TWIST_CW) == forwards, weave_down, weave_up))
+
+
+class StrandGeometry:
+    """Computes the positions of the points of strands recorded by a StrandTableBuilder,
+    for any positions of the mesh vertices.
+    This matches the output of BezierBuilder and RibbonBuilder, but works on whole arrays at once."""
+    def __init__(self, topology, table, twists):
+        self.topology = topology
+        self.prev_loops = np.frombuffer(table.prev_loops, dtype=np.intc)
+        self.loops = np.frombuffer(table.loops, dtype=np.intc)
+        self.forwards = np.frombuffer(table.forwards, dtype=np.int8).astype(bool)
+        self.twists = np.asarray(twists)[topology.loop_edges[self.loops]]
+        self.strand_starts = np.frombuffer(table.strand_starts, dtype=np.intc)
+        # Index of the previous and next point along each (cyclic) strand
+        part_count = len(self.loops)
+        strand_ends = np.append(self.strand_starts[1:], part_count)[:len(self.strand_starts)]
+        strand_sizes = strand_ends - self.strand_starts
+        starts = np.repeat(self.strand_starts, strand_sizes)
+        ends = np.repeat(strand_ends, strand_sizes)
+        parts = np.arange(part_count)
+        self.prev_parts = np.where(parts == starts, ends - 1, parts - 1)
+        self.next_parts = np.where(parts == ends - 1, starts, parts + 1)
+        # Index of each point within its strand, and the size of that strand
+        self.counts = parts - starts
+        self.sizes = ends - starts
+
+    def get_strand_parts(self):
+        """Returns the strand_part of every point."""
+        loop_verts = self.topology.loop_verts
+        return 2 * self.prev_loops + ((loop_verts[self.loops] == loop_verts[self.prev_loops]) == self.forwards)
+
+    def get_offset_normals(self, co, weave_up, weave_down):
+        topology = self.topology
+        loop_normals = get_loop_normals(co, topology)
+        normals = normalized(loop_normals[self.loops] + loop_normals[self.prev_loops])
+        offsets = -get_offsets(weave_up, weave_down, self.twists, self.forwards)[:, None] * normals
+        return offsets, normals
+
+    def get_bezier_points(self, co, crossing_angle, crossing_strength, handle_type, weave_up, weave_down):
+        """Returns arrays of the co, handle_left and handle_right of every bezier point."""
+        topology = self.topology
+        offsets, normals = self.get_offset_normals(co, weave_up, weave_down)
+        edge_verts = topology.edge_verts[topology.loop_edges[self.loops]]
+        points = co[edge_verts].mean(axis=1) + offsets
+        if handle_type == "AUTO":
+            return (points,) + get_auto_handles(points, self.prev_parts, self.next_parts)
+        s = sin(crossing_angle) * crossing_strength
+        c = cos(crossing_angle) * crossing_strength
+        tangents = normalized(co[topology.loop_next_verts[self.loops]] - co[topology.loop_verts[self.loops]])
+        binormals = normalized(np.cross(normals, tangents))
+        tangents[~self.forwards] *= -1
+        delta = s * binormals + c * tangents
+        return points, points - delta, points + delta
+
+    def get_ribbon_vertices(self, co, weave_up, weave_down, length, breadth):
+        """Returns an array of the vertices of the ribbon, four per point."""
+        topology = self.topology
+        offsets, normals = self.get_offset_normals(co, weave_up, weave_down)
+        centers = get_face_centers(co, topology)
+        v1 = co[topology.loop_verts[self.loops]]
+        v2 = co[topology.loop_next_verts[self.loops]]
+        center1 = centers[topology.loop_faces[self.prev_loops]]
+        center2 = centers[topology.loop_faces[self.loops]]
+        # Same reordering as RibbonBuilder.add_loop
+        straight = (self.twists == STRAIGHT)[:, None]
+        forward = self.forwards[:, None]
+        a = np.where(straight, np.where(forward, center1, v2), np.where(forward, v1, center1))
+        b = np.where(straight, np.where(forward, v1, center1), np.where(forward, center1, v2))
+        c = np.where(straight, np.where(forward, v2, center1), np.where(forward, v2, center2))
+        d = np.where(straight, np.where(forward, center1, v1), np.where(forward, center2, v1))
+        # Same as RibbonBuilder.get_sub_face
+        hc = length / 2.0
+        hw = breadth / 2.0
+        ad1, bc1 = lerp(a, d, 0.5 - hc), lerp(b, c, 0.5 - hc)
+        ad2, bc2 = lerp(a, d, 0.5 + hc), lerp(b, c, 0.5 + hc)
+        vertices = np.stack((lerp(ad1, bc1, 0.5 - hw),
+                             lerp(ad1, bc1, 0.5 + hw),
+                             lerp(ad2, bc2, 0.5 + hw),
+                             lerp(ad2, bc2, 0.5 - hw)), axis=1) + offsets[:, None]
+        return vertices.reshape(-1, 3)
+
+    def get_ribbon_faces(self, length):
+        """Returns the faces of the ribbon with vertices from get_ribbon_vertices, as a tuple of arrays
+        (vertex index per face corner, face sizes, uv per face corner, strand part per face,
+        position along the strand per vertex).
+        These are the same faces as RibbonBuilder makes, but in a different order."""
+        i = 4 * np.arange(len(self.loops))
+        j = 4 * self.prev_parts
+        u1 = self.counts / self.sizes
+        u2 = (self.counts + length) / self.sizes
+        prev_u2 = u2[self.prev_parts]
+        # The face closing a strand wraps the uvs around
+        next_u1 = u1 + (self.counts == 0)
+        zeros = np.zeros_like(u1)
+        ones = np.ones_like(u1)
+        # Two triangles per point, and a quad joining each point to the previous one
+        triangles = np.stack((i, i + 1, i + 2, i, i + 2, i + 3), axis=1)
+        quads = np.stack((j + 3, j + 2, i + 1, i), axis=1)
+        triangle_uvs = np.stack((u1, zeros, u1, ones, u2, ones, u1, zeros, u2, ones, u2, zeros), axis=1)
+        quad_uvs = np.stack((prev_u2, zeros, prev_u2, ones, next_u1, ones, next_u1, zeros), axis=1)
+        loop_verts = np.concatenate((triangles.ravel(), quads.ravel())).astype(np.intc)
+        face_sizes = np.concatenate((np.full(2 * len(i), 3), np.full(len(i), 4))).astype(np.intc)
+        uvs = np.concatenate((triangle_uvs.ravel(), quad_uvs.ravel())).astype(np.float32)
+        parts = self.get_strand_parts()
+        face_parts = np.concatenate((np.repeat(parts, 2), parts))
+        vertex_params = np.stack((u1, u1, u2, u2), axis=1).ravel().astype(np.float32)
+        return loop_verts, face_sizes, uvs, face_parts, vertex_params
+
+
+def get_auto_handles(points, prev_parts, next_parts):
+    """Computes the handles blender assigns to bezier points with automatic handle types."""
+    dvec_a = points - points[prev_parts]
+    dvec_b = points[next_parts] - points
+    len_a = np.linalg.norm(dvec_a, axis=1, keepdims=True)
+    len_b = np.linalg.norm(dvec_b, axis=1, keepdims=True)
+    len_a[len_a == 0] = 1
+    len_b[len_b == 0] = 1
+    tangents = dvec_b / len_b + dvec_a / len_a
+    lengths = np.linalg.norm(tangents, axis=1, keepdims=True) * 2.5614
+    lengths[lengths == 0] = np.inf
+    return points - tangents * (len_a / lengths), points + tangents * (len_b / lengths)
+
+
+def store_twists(mesh, twists):
+    """Stores a twist per edge as an integer edge attribute of mesh."""
+    attribute = mesh.attributes.get(TWIST_ATTRIBUTE)
+    if attribute is None:
+        try:
+            attribute = mesh.attributes.new(TWIST_ATTRIBUTE, "INT8", "EDGE")
+        except TypeError:
+            # Older blender versions lack byte attributes
+            attribute = mesh.attributes.new(TWIST_ATTRIBUTE, "INT", "EDGE")
+    attribute.data.foreach_set("value", np.asarray(twists, dtype=np.intc))
+
+
+def load_twists(mesh):
+    """Reads twists stored by store_twists.
+    Returns None if mesh has no stored twists."""
+    attribute = getattr(mesh, "attributes", {}).get(TWIST_ATTRIBUTE)
+    if attribute is None or attribute.domain != "EDGE":
+        return None
+    values = np.zeros(len(mesh.edges), dtype=np.intc)
+    attribute.data.foreach_get("value", values)
+    # Edges with faces must always be crossed, so replace anything else with straight
+    values[(values < TWIST_CW) | (values > TWIST_CCW)] = STRAIGHT
+    return values.astype(np.uint8)
+
+
+def get_vertex_weights(obj, name):
+    """Reads a value per vertex from the named vertex group or point attribute of obj.
+    Returns None if there is no such data.
+    Blender has no bulk access to vertex groups, so they are read one vertex at a time,
+    which dominates the time taken for huge meshes. Point attributes are read all at once."""
+    if not name:
+        return None
+    mesh = obj.data
+    group = obj.vertex_groups.get(name)
+    if group is not None:
+        index = group.index
+        return np.fromiter((next((g.weight for g in vert.groups if g.group == index), 0.0)
+                            for vert in mesh.vertices), dtype=np.float64, count=len(mesh.vertices))
+    attributes = getattr(mesh, "attributes", None)
+    attribute = attributes.get(name) if attributes is not None else None
+    if attribute is not None and attribute.domain == "POINT" and attribute.data_type in ("FLOAT", "INT"):
+        weights = np.zeros(len(mesh.vertices), dtype=np.float32 if attribute.data_type == "FLOAT" else np.intc)
+        attribute.data.foreach_get("value", weights)
+        return weights
+    return None
 
 
 def make_material(name, diffuse):
@@ -708,24 +1591,95 @@ def make_material(name, diffuse):
     return mat
 
 
+def get_material(name, diffuse):
+    """Finds a material made by a previous run, or makes a new one."""
+    mat = bpy.data.materials.get(name)
+    if mat is None:
+        mat = make_material(name, diffuse)
+    return mat
+
+
+def get_attribute_material():
+    """Gets a single material coloring faces by the strand attribute written by RibbonBuilder.store_attributes."""
+    mat = bpy.data.materials.get(ATTRIBUTE_MATERIAL)
+    if mat is not None:
+        return mat
+    mat = make_material(ATTRIBUTE_MATERIAL, (0.5, 0.5, 0.5))
+    mat.use_nodes = True
+    nodes = mat.node_tree.nodes
+    links = mat.node_tree.links
+    attribute = nodes.new("ShaderNodeAttribute")
+    attribute.attribute_name = STRAND_ATTRIBUTE
+    # Spread hues of consecutive strands using the golden ratio
+    multiply = nodes.new("ShaderNodeMath")
+    multiply.operation = "MULTIPLY"
+    multiply.inputs[1].default_value = 0.618034
+    fract = nodes.new("ShaderNodeMath")
+    fract.operation = "FRACT"
+    try:
+        hsv = nodes.new("ShaderNodeCombineColor")
+        hsv.mode = "HSV"
+    except RuntimeError:
+        # Older blender versions
+        hsv = nodes.new("ShaderNodeCombineHSV")
+    hsv.inputs[1].default_value = 0.7
+    hsv.inputs[2].default_value = 0.25
+    links.new(attribute.outputs["Fac"], multiply.inputs[0])
+    links.new(multiply.outputs[0], fract.inputs[0])
+    links.new(fract.outputs[0], hsv.inputs[0])
+    bsdf = nodes.get("Principled BSDF")
+    if bsdf is not None:
+        links.new(hsv.outputs[0], bsdf.inputs["Base Color"])
+    return mat
+
+
 def setup_materials(materials_array, materials):
     if materials is not None:
-        material_count = len(set(materials.values()))
+        material_count = int(materials.max()) + 1 if len(materials) else 0
         c = Color()
         for i in range(material_count):
             c.hsv = (i / float(material_count), 0.7, 0.25)
-            materials_array.append(make_material("CelticKnot", c))
+            materials_array.append(get_material("CelticKnot {}/{}".format(i + 1, material_count), c))
+
+
+def new_knot_curve(materials, curve=None):
+    """Creates an empty curve to add strands to, or clears curve if given."""
+    if curve is None:
+        curve = bpy.data.curves.new("Celtic", "CURVE")
+    else:
+        curve.splines.clear()
+        curve.materials.clear()
+    curve.dimensions = "3D"
+    curve.twist_mode = "MINIMUM"
+    setup_materials(curve.materials, materials)
+    return curve
+
+
+def select_only(context, obj):
+    for other in context.selected_objects:
+        other.select_set(False)
+    obj.select_set(True)
+    context.view_layer.objects.active = obj
 
 
 def create_bezier(context, bm, twists,
-                  crossing_angle, crossing_strength, handle_type, weave_up, weave_down, materials):
-    builder = BezierBuilder(bm, crossing_angle, crossing_strength, handle_type, weave_up, weave_down, materials)
-    visit_strands(bm, twists, builder)
-    curve = builder.curve
+                  crossing_angle, crossing_strength, handle_type, weave_up, weave_down, materials,
+                  visit=visit_strands, target=None, midpoints=None):
+    builder = BezierBuilder(bm, crossing_angle, crossing_strength, handle_type, weave_up, weave_down, materials,
+                            target.data if target is not None else None, midpoints=midpoints)
+    visit(bm, twists, builder)
+    return add_curve_object(context, builder.curve, handle_type, target)
 
+
+def add_curve_object(context, curve, handle_type, target=None):
+    """Adds an object for a curve made by new_knot_curve (unless it belongs to target),
+    and sets the handle type of every point."""
     orig_obj = context.active_object
-    # Create an object from the curve
-    object_utils.object_data_add(context, curve, operator=None)
+    if target is None:
+        # Create an object from the curve
+        object_utils.object_data_add(context, curve, operator=None)
+    else:
+        select_only(context, target)
     # Set the handle type (this is faster than setting it pointwise)
     bpy.ops.object.editmode_toggle()
     bpy.ops.curve.select_all(action="SELECT")
@@ -742,42 +1696,829 @@ def create_bezier(context, bm, twists,
 
 
 def create_ribbon(context, bm, twists, weave_up, weave_down, length, breadth,
-                  strand_analysis, materials):
-    builder = RibbonBuilder(weave_up, weave_down, length, breadth, strand_analysis, materials)
-    visit_strands(bm, twists, builder)
-    mesh = builder.make_mesh()
-    orig_obj = context.active_object
-    object_utils.object_data_add(context, mesh, operator=None)
-    mesh_obj = context.active_object
-    context.view_layer.objects.active = orig_obj
+                  strand_analysis, materials, visit=visit_strands, attributes=False, target=None, shared_ends=False):
+    builder = RibbonBuilder(weave_up, weave_down, length, breadth, strand_analysis, materials, shared_ends)
+    visit(bm, twists, builder)
+    if target is None:
+        mesh = builder.make_mesh()
+        orig_obj = context.active_object
+        object_utils.object_data_add(context, mesh, operator=None)
+        mesh_obj = context.active_object
+        context.view_layer.objects.active = orig_obj
+    else:
+        mesh = builder.make_mesh(target.data)
+        mesh.materials.clear()
+        mesh_obj = target
 
     setup_materials(mesh.materials, materials)
+    if attributes:
+        builder.store_attributes(mesh)
+        mesh.materials.append(get_attribute_material())
 
     return mesh_obj
 
 
-def create_pipe_from_bezier(context, curve_obj, thickness):
-    bpy.ops.curve.primitive_bezier_circle_add()
-    bpy.ops.transform.resize(value=(thickness,) * 3)
-    circle = context.active_object
-    curve_obj.data.bevel_object = circle
-    curve_obj.select_set(True)
-    context.view_layer.objects.active = curve_obj
-    # For some reason only works with keep_original=True
-    bpy.ops.object.convert(target="MESH", keep_original=True)
-    new_obj = context.view_layer.objects.active
-    new_obj.select_set(False)
-    curve_obj.select_set(True)
-    circle.select_set(True)
-    bpy.ops.object.delete()
-    new_obj.select_set(True)
-    context.view_layer.objects.active = new_obj
-
-
-class CelticKnotOperator(bpy.types.Operator):
-    bl_idname = "object.celtic_knot_operator"
-    bl_label = "Celtic Knot"
-    bl_options = {'REGISTER', 'UNDO', 'PRESET'}
+def create_pipe_from_bezier(context, curve_obj, thickness, target=None):
+    """Converts a bezier object into a round pipe mesh of the given radius, removing the curve.
+    If target is given, its mesh is overwritten instead of creating a new object."""
+    curve = curve_obj.data
+    curve.bevel_depth = thickness
+    curve.bevel_resolution = 10
+    eval_obj = curve_obj.evaluated_get(context.evaluated_depsgraph_get())
+    if target is None:
+        mesh = bpy.data.meshes.new_from_object(eval_obj)
+        object_utils.object_data_add(context, mesh, operator=None)
+        new_obj = context.active_object
+        new_obj.matrix_world = curve_obj.matrix_world
+    else:
+        bm = bmesh.new()
+        bm.from_mesh(eval_obj.to_mesh())
+        bm.to_mesh(target.data)
+        bm.free()
+        eval_obj.to_mesh_clear()
+        target.data.materials.clear()
+        for mat in curve.materials:
+            target.data.materials.append(mat)
+        new_obj = target
+    # Remove the curve entirely, so no orphan data is left behind
+    bpy.data.objects.remove(curve_obj)
+    bpy.data.curves.remove(curve)
+    select_only(context, new_obj)
+    return new_obj
+
+
+## Animation (updating the geometry of knots as their framework mesh deforms)
+
+# Knots that follow deformation, by output object name
+knot_animations = {}
+
+# Custom property of knots that follow deformation, naming their source object and holding their settings,
+# so that they can be rebuilt when the file is loaded again
+FOLLOW_PROPERTY = "celtic_knot_follow"
+
+
+def get_evaluated_positions(obj, depsgraph):
+    """Reads the vertex positions of obj after modifiers, shape keys etc. have been applied."""
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    eval_obj.to_mesh_clear()
+    return co.reshape(-1, 3).astype(np.float64)
+
+
+class KnotAnimation:
+    """Stores the topology dependent results of generating a knot,
+    so the output can be updated by only recomputing positions."""
+    def __init__(self, source_name, output_name, remesh_type, orig_edge_verts, orig_vert_count, geometry,
+                 crossing_angle, crossing_strength, handle_type, weave_up, weave_down, length, breadth):
+        self.source_name = source_name
+        self.output_name = output_name
+        self.remesh_type = remesh_type
+        self.orig_edge_verts = orig_edge_verts
+        self.orig_vert_count = orig_vert_count
+        self.geometry = geometry
+        self.crossing_angle = crossing_angle
+        self.crossing_strength = crossing_strength
+        self.handle_type = handle_type
+        self.weave_up = weave_up
+        self.weave_down = weave_down
+        self.length = length
+        self.breadth = breadth
+
+    def update(self, depsgraph):
+        """Moves the output to match the current shape of the source.
+        Returns False if this is no longer possible."""
+        source = bpy.data.objects.get(self.source_name)
+        output = bpy.data.objects.get(self.output_name)
+        if source is None or output is None:
+            return False
+        co = get_evaluated_positions(source, depsgraph)
+        if len(co) != self.orig_vert_count:
+            return False
+        co = remesh_vertex_values(self.orig_edge_verts, co, self.remesh_type)
+        geometry = self.geometry
+        # The output may have been edited, or regenerated differently
+        if output.type == "CURVE":
+            if len(output.data.splines) != len(geometry.strand_starts):
+                return False
+        elif len(output.data.vertices) != 4 * len(geometry.loops):
+            return False
+        if output.type == "CURVE":
+            points, handle_lefts, handle_rights = geometry.get_bezier_points(
+                co, self.crossing_angle, self.crossing_strength, self.handle_type, self.weave_up, self.weave_down)
+            points = points.astype(np.float32)
+            handle_lefts = handle_lefts.astype(np.float32)
+            handle_rights = handle_rights.astype(np.float32)
+            ends = np.append(geometry.strand_starts[1:], len(points))
+            for spline, start, end in zip(output.data.splines, geometry.strand_starts, ends):
+                bezier_points = spline.bezier_points
+                bezier_points.foreach_set("co", points[start:end].ravel())
+                bezier_points.foreach_set("handle_left", handle_lefts[start:end].ravel())
+                bezier_points.foreach_set("handle_right", handle_rights[start:end].ravel())
+            output.data.update_tag()
+        else:
+            vertices = geometry.get_ribbon_vertices(co, self.weave_up, self.weave_down, self.length, self.breadth)
+            output.data.vertices.foreach_set("co", vertices.astype(np.float32).ravel())
+            output.data.update()
+        return True
+
+
+def new_knot_animation(source_name, output_name, settings, orig_edge_verts, orig_vert_count, geometry):
+    """Makes a KnotAnimation for a knot generated with the given operator settings."""
+    return KnotAnimation(source_name, output_name, settings.remesh_type, orig_edge_verts, orig_vert_count, geometry,
+                         settings.crossing_angle, settings.crossing_strength, settings.handle_type,
+                         settings.weave_up, settings.weave_down, settings.length / 100, settings.breadth / 100)
+
+
+@persistent
+def update_knot_animations(scene, depsgraph=None):
+    if depsgraph is None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+    for name, animation in list(knot_animations.items()):
+        if not animation.update(depsgraph):
+            print("Celtic Knot {} no longer follows deformation of {}".format(name, animation.source_name))
+            del knot_animations[name]
+
+
+@persistent
+def load_knot_animations(*args):
+    """Rebuilds the animations of the knots in a newly loaded file, by regenerating them from their sources
+    (only the strands are kept, the knots themselves are left as saved)."""
+    knot_animations.clear()
+    for output in bpy.data.objects:
+        stored = output.get(FOLLOW_PROPERTY)
+        if stored is None:
+            continue
+        settings = SimpleNamespace(**stored.to_dict())
+        # Colors don't affect positions
+        settings.coloring_type = "NONE"
+        source = bpy.data.objects.get(settings.source_name)
+        try:
+            if source is None or source.type != "MESH":
+                raise ValueError("Framework mesh {} not found".format(settings.source_name))
+            result = compute_knot(read_knot_input(source, settings), settings)
+        except Exception as e:
+            print("Celtic Knot {} no longer follows deformation: {}".format(output.name, e))
+            continue
+        knot_animations[output.name] = new_knot_animation(
+            source.name, output.name, settings,
+            result["orig_edge_verts"], result["orig_vert_count"], result["geometry"])
+
+
+def add_knot_animation(animation, output_obj, settings):
+    """Makes output_obj follow deformation, remembering settings (from get_settings) to rebuild it on load."""
+    output_obj[FOLLOW_PROPERTY] = dict(vars(settings), source_name=animation.source_name)
+    knot_animations[animation.output_name] = animation
+
+
+def remove_knot_animation(output_obj):
+    """Stops output_obj following deformation, as when it is overwritten by another knot."""
+    knot_animations.pop(output_obj.name, None)
+    if FOLLOW_PROPERTY in output_obj:
+        del output_obj[FOLLOW_PROPERTY]
+
+
+## Background generation (computing knots away from Blender's main thread)
+
+KNOT_STAGES = ("Remeshing", "Computing twists", "Tracing strands", "Building geometry")
+
+
+def get_twists(bm, settings, orig_face_count, weights=None, stored_twists=None):
+    """Computes the twist of every edge of bm (after remeshing) for the operator settings.
+    Returns None if stored twists are needed but not available."""
+    if settings.weave_type == "CELTIC":
+        return get_celtic_twists(bm, settings.twist_proportion / 100, weights)
+    if settings.weave_type == "STORED":
+        return stored_twists if settings.remesh_type == "NONE" else None
+    if settings.remesh_type == "MEDIAL":
+        return get_medial_twill_twists(bm, orig_face_count)
+    return get_twill_twists(bm, settings.refine_iterations, settings.refine_time)
+
+
+def read_mesh_arrays(mesh):
+    """Copies the vertex positions, edges and faces of a blender mesh into arrays."""
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    edges = np.empty(len(mesh.edges) * 2, dtype=np.intc)
+    mesh.edges.foreach_get("vertices", edges)
+    loop_verts = np.empty(len(mesh.loops), dtype=np.intc)
+    mesh.loops.foreach_get("vertex_index", loop_verts)
+    face_starts = np.empty(len(mesh.polygons), dtype=np.intc)
+    mesh.polygons.foreach_get("loop_start", face_starts)
+    face_sizes = np.empty(len(mesh.polygons), dtype=np.intc)
+    mesh.polygons.foreach_get("loop_total", face_sizes)
+    return {
+        "co": co.reshape(-1, 3).astype(np.float64),
+        "edges": edges.reshape(-1, 2),
+        "loop_verts": loop_verts,
+        "face_starts": face_starts,
+        "face_sizes": face_sizes,
+    }
+
+
+def get_input_faces(knot_input):
+    """Converts the flat face arrays of read_mesh_arrays into a list of vertex indices per face."""
+    loop_verts = knot_input["loop_verts"].tolist()
+    return [loop_verts[start:start + size]
+            for start, size in zip(knot_input["face_starts"].tolist(), knot_input["face_sizes"].tolist())]
+
+
+def read_knot_input(obj, settings):
+    """Reads everything compute_knot needs from obj."""
+    knot_input = read_mesh_arrays(obj.data)
+    if settings.weave_type == "CELTIC":
+        knot_input["weights"] = get_vertex_weights(obj, settings.twist_weights)
+    if settings.weave_type == "STORED":
+        knot_input["twists"] = load_twists(obj.data)
+    return knot_input
+
+
+def compute_knot(knot_input, settings, report_stage=None):
+    """Runs the stages of generating a knot that don't need Blender, using a PyMesh.
+    knot_input is from read_knot_input, and settings has the operator properties.
+    report_stage is called with the index in KNOT_STAGES of each stage as it starts.
+    Returns a dict of arrays describing the output, for create_knot_output."""
+    if report_stage is None:
+        report_stage = lambda stage: None
+    report_stage(0)
+    orig_mesh = PyMesh(knot_input["co"], get_input_faces(knot_input), knot_input["edges"].tolist())
+    mesh = remesh(orig_mesh, settings.remesh_type)
+
+    report_stage(1)
+    weights = knot_input.get("weights")
+    if weights is not None:
+        weights = remesh_vertex_values(knot_input["edges"], weights, settings.remesh_type)
+    twists = get_twists(mesh, settings, len(orig_mesh.faces), weights, knot_input.get("twists"))
+    if twists is None:
+        raise ValueError(NO_STORED_TWISTS)
+
+    report_stage(2)
+    table = get_strand_table(mesh, twists)
+    attributes = settings.coloring_type == "ATTRIBUTE" and settings.output_type == RIBBON
+    if settings.coloring_type == "NONE" and not attributes:
+        strands = braids = materials = None
+    else:
+        strand_analysis = StrandAnalysisBuilder(mesh)
+        visit_strand_runs(mesh, twists, strand_analysis, table, table.strand_runs(), get_loop_lookup(mesh))
+        strands = strand_analysis.get_strands()
+        braids = strand_analysis.get_braids()
+        if attributes:
+            materials = None
+        else:
+            materials = strands if settings.coloring_type == "STRAND" else braids
+
+    report_stage(3)
+    geometry = StrandGeometry(MeshTopology(mesh), table, twists)
+    result = {
+        "twists": twists,
+        "geometry": geometry,
+        "orig_edge_verts": knot_input["edges"],
+        "orig_vert_count": len(knot_input["co"]),
+        "materials": materials,
+    }
+    parts = geometry.get_strand_parts()
+    if settings.output_type in (BEZIER, PIPE):
+        points, handle_lefts, handle_rights = geometry.get_bezier_points(
+            mesh.co, settings.crossing_angle, settings.crossing_strength, settings.handle_type,
+            settings.weave_up, settings.weave_down)
+        # Like BezierBuilder, each spline uses the material of its last point
+        strand_ends = np.append(geometry.strand_starts[1:], len(parts))[:len(geometry.strand_starts)]
+        result.update({
+            "points": points.astype(np.float32),
+            "handle_lefts": handle_lefts.astype(np.float32),
+            "handle_rights": handle_rights.astype(np.float32),
+            "strand_starts": geometry.strand_starts,
+            "strand_materials": (np.zeros(len(strand_ends), dtype=np.intc) if materials is None else
+                                 materials[parts[strand_ends - 1]].astype(np.intc)),
+        })
+    else:
+        length = settings.length / 100
+        vertices = geometry.get_ribbon_vertices(mesh.co, settings.weave_up, settings.weave_down,
+                                                length, settings.breadth / 100)
+        loop_verts, face_sizes, uvs, face_parts, vertex_params = geometry.get_ribbon_faces(length)
+        result.update({
+            "vertices": vertices.astype(np.float32),
+            "loop_verts": loop_verts,
+            "face_sizes": face_sizes,
+            "uvs": uvs,
+            "face_materials": (np.zeros(len(face_sizes), dtype=np.intc) if materials is None else
+                               materials[face_parts].astype(np.intc)),
+        })
+        if attributes:
+            result["attributes"] = (strands[face_parts], braids[face_parts], vertex_params)
+    return result
+
+
+def make_bezier_curve(result, handle_type, curve=None):
+    """Creates a curve with the splines computed by compute_knot, or overwrites curve if given."""
+    curve = new_knot_curve(result["materials"], curve)
+    points = result["points"]
+    starts = result["strand_starts"]
+    ends = np.append(starts[1:], len(points))
+    for start, end, material in zip(starts, ends, result["strand_materials"]):
+        spline = curve.splines.new("BEZIER")
+        spline.use_cyclic_u = True
+        spline.material_index = material
+        bezier_points = spline.bezier_points
+        bezier_points.add(end - start - 1)
+        bezier_points.foreach_set("co", points[start:end].ravel())
+        if handle_type != "AUTO":
+            bezier_points.foreach_set("handle_left", result["handle_lefts"][start:end].ravel())
+            bezier_points.foreach_set("handle_right", result["handle_rights"][start:end].ravel())
+    return curve
+
+
+def make_ribbon_mesh(result, me=None):
+    """Creates a mesh with the ribbon computed by compute_knot, or overwrites me if given."""
+    if me is None:
+        me = bpy.data.meshes.new("")
+    else:
+        me.clear_geometry()
+    vertices = result["vertices"]
+    loop_verts = result["loop_verts"]
+    face_sizes = result["face_sizes"]
+    me.vertices.add(len(vertices))
+    me.vertices.foreach_set("co", vertices.ravel())
+    me.loops.add(len(loop_verts))
+    me.loops.foreach_set("vertex_index", loop_verts)
+    me.polygons.add(len(face_sizes))
+    me.polygons.foreach_set("loop_start", (np.cumsum(face_sizes) - face_sizes).astype(np.intc))
+    if bpy.app.version < (4, 0, 0):
+        # Later versions work this out from the loop starts
+        me.polygons.foreach_set("loop_total", face_sizes)
+    me.polygons.foreach_set("material_index", result["face_materials"])
+    me.uv_layers.new(name = "")
+    me.uv_layers[0].data.foreach_set("uv", result["uvs"])
+    me.update(calc_edges=True)
+    return me
+
+
+def create_knot_output(context, result, settings, target=None):
+    """Creates an object from the output of compute_knot, or overwrites target if given."""
+    if settings.output_type in (BEZIER, PIPE):
+        thick = settings.output_type == PIPE and settings.thickness > 0
+        curve = make_bezier_curve(result, settings.handle_type,
+                                  target.data if target is not None and not thick else None)
+        curve_obj = add_curve_object(context, curve, settings.handle_type, None if thick else target)
+        if thick:
+            return create_pipe_from_bezier(context, curve_obj, settings.thickness, target)
+        return curve_obj
+
+    if target is None:
+        mesh = make_ribbon_mesh(result)
+        orig_obj = context.active_object
+        object_utils.object_data_add(context, mesh, operator=None)
+        mesh_obj = context.active_object
+        context.view_layer.objects.active = orig_obj
+    else:
+        mesh = make_ribbon_mesh(result, target.data)
+        mesh.materials.clear()
+        mesh_obj = target
+    setup_materials(mesh.materials, result["materials"])
+    if "attributes" in result:
+        store_ribbon_attributes(mesh, *result["attributes"])
+        mesh.materials.append(get_attribute_material())
+    return mesh_obj
+
+
+class KnotCancelled(Exception):
+    pass
+
+
+class KnotJob(Thread):
+    """Runs compute_knot in a background thread, recording progress.
+    Setting cancelled stops the job at the start of the next stage."""
+    def __init__(self, knot_input, settings):
+        super().__init__(daemon=True)
+        self.knot_input = knot_input
+        self.settings = settings
+        self.stage = 0
+        self.cancelled = False
+        self.result = None
+        self.error = None
+
+    def report_stage(self, stage):
+        if self.cancelled:
+            raise KnotCancelled()
+        self.stage = stage
+
+    def run(self):
+        try:
+            self.result = compute_knot(self.knot_input, self.settings, self.report_stage)
+        except KnotCancelled:
+            pass
+        except Exception as e:
+            traceback.print_exc()
+            self.error = e
+
+
+def can_use_processes():
+    """Checks worker processes can be started, which needs a python executable
+    (older blender versions report the blender executable instead)."""
+    return os.path.basename(sys.executable).lower().startswith("python")
+
+
+def compute_knots(knot_inputs, settings, processes=0):
+    """Runs compute_knot on every input, using a pool of worker processes if possible.
+    processes is the size of the pool, or zero for one per CPU.
+    Returns the result for each input, or the exception raised for it."""
+    if processes != 1 and len(knot_inputs) > 1 and can_use_processes():
+        try:
+            # Forking a process with blender's threads is unsafe, so always start fresh ones
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(processes or None, mp_context=context) as pool:
+                futures = [pool.submit(compute_knot, knot_input, settings) for knot_input in knot_inputs]
+                results = [future.exception() or future.result() for future in futures]
+            if not any(isinstance(result, BrokenProcessPool) for result in results):
+                return results
+        except Exception:
+            traceback.print_exc()
+        # Fall back to computing everything here
+    results = []
+    for knot_input in knot_inputs:
+        try:
+            results.append(compute_knot(knot_input, settings))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+## Incremental updates (regenerating only the strands near edits to the framework mesh)
+
+# Caches of generated knots, by output object name
+knot_caches = {}
+
+
+def get_edge_signatures(bm, precision=6):
+    """Identifies each edge by the positions of its vertices and the vertices of its faces,
+    so edges can be matched between edited versions of a mesh, whatever their indices.
+    Returns a list by edge index."""
+    vert_keys = [tuple(round(float(c), precision) for c in vert.co) for vert in bm.verts]
+    face_keys = []
+    for face in bm.faces:
+        key = [vert_keys[vert.index] for vert in face.verts]
+        # Start from the least vertex, so the key doesn't depend on the first loop
+        i = key.index(min(key))
+        face_keys.append(tuple(key[i:] + key[:i]))
+    signatures = [None] * len(bm.edges)
+    for edge in bm.edges:
+        v1, v2 = sorted(vert_keys[vert.index] for vert in edge.verts)
+        signatures[edge.index] = (v1, v2, tuple(sorted(face_keys[loop.face.index] for loop in edge.link_loops)))
+    return signatures
+
+
+class KnotCache:
+    """Remembers the twists and strands of a generated bezier knot by edge signature,
+    so that a later run on an edited mesh can keep the splines of strands away from the edits.
+    Strands are recorded by visiting them with this as the builder."""
+    def __init__(self, settings_key, edge_twists):
+        self.settings_key = settings_key
+        self.edge_twists = edge_twists
+        # Edges crossed by each strand, and strands crossing each edge
+        self.strand_edges = {}
+        self.edge_strands = defaultdict(set)
+        # Strand id of each spline, in order
+        self.spline_strands = []
+        self.point_count = 0
+        self.next_id = 0
+        self.signatures = None
+        self.current_edges = None
+
+    def add_strands(self, visit, bm, twists, signatures):
+        """Records the strands visited by visit, which must be in the same order as their splines."""
+        self.signatures = signatures
+        visit(bm, twists, self)
+        self.signatures = None
+
+    def remove_strands(self, strand_ids):
+        """Forgets strands, returning the indices of their splines."""
+        indices = [i for i, s in enumerate(self.spline_strands) if s in strand_ids]
+        self.spline_strands = [s for s in self.spline_strands if s not in strand_ids]
+        for s in strand_ids:
+            edges = self.strand_edges.pop(s)
+            self.point_count -= len(edges)
+            for signature in edges:
+                strands = self.edge_strands[signature]
+                strands.discard(s)
+                if not strands:
+                    del self.edge_strands[signature]
+        return indices
+
+    # Builder methods
+    def start_strand(self):
+        self.current_edges = []
+
+    def add_loop(self, prev_loop, loop, twist, forward):
+        self.current_edges.append(self.signatures[loop.edge.index])
+
+    def end_strand(self, cyclic=True):
+        strand_id = self.next_id
+        self.next_id += 1
+        self.strand_edges[strand_id] = self.current_edges
+        for signature in self.current_edges:
+            self.edge_strands[signature].add(strand_id)
+        self.spline_strands.append(strand_id)
+        self.point_count += len(self.current_edges)
+
+
+def update_twists(bm, settings, orig_face_count, signatures, cache, weights=None, stored_twists=None):
+    """Computes twists like get_twists, but keeping the cached twist of every edge that hasn't changed."""
+    if settings.weave_type == "STORED":
+        # The stored twists may have been edited themselves
+        return get_twists(bm, settings, orig_face_count, weights, stored_twists)
+    kept = np.fromiter((cache.edge_twists.get(signature, UNASSIGNED) for signature in signatures),
+                       dtype=np.uint8, count=len(signatures))
+    if settings.weave_type == "TWILL" and settings.remesh_type != "MEDIAL":
+        # Solve the new edges by the same local votes as the rest
+        return get_twill_twists(bm, settings.refine_iterations, settings.refine_time, initial=kept)
+    twists = get_twists(bm, settings, orig_face_count, weights)
+    return np.where(kept == UNASSIGNED, twists, kept)
+
+
+def get_dirty_edges(cache, signatures, twists):
+    """Compares an edited mesh with the cached one.
+    Any face next to an edge that was added, removed or twisted differently may change the path of strands
+    crossing it, so the strands crossing the edges of such faces need tracing again.
+    Returns those edges (as indices into signatures), the ids of cached strands to remove,
+    and the twists by signature of the edited mesh."""
+    edge_twists = dict(zip(signatures, twists.tolist()))
+    dirty_faces = set()
+    for signature, twist in edge_twists.items():
+        if cache.edge_twists.get(signature) != twist:
+            dirty_faces.update(signature[2])
+    for signature, twist in cache.edge_twists.items():
+        if edge_twists.get(signature) != twist:
+            dirty_faces.update(signature[2])
+    dirty_edges = [i for i, signature in enumerate(signatures) if not dirty_faces.isdisjoint(signature[2])]
+    removed = set()
+    for signature, strands in cache.edge_strands.items():
+        if not dirty_faces.isdisjoint(signature[2]):
+            removed.update(strands)
+    return dirty_edges, removed, edge_twists
+
+
+def update_cached_strands(cache, bm, twists, signatures):
+    """Updates the cache to match the edited mesh bm.
+    Returns the spline indices of the strands removed,
+    and a visitor like visit_strands for the strands replacing them."""
+    dirty_edges, removed, cache.edge_twists = get_dirty_edges(cache, signatures, twists)
+    removed_splines = cache.remove_strands(removed)
+    start_loops = [loop for e in dirty_edges for loop in bm.edges[e].link_loops]
+    visit = partial(visit_strands, start_loops=start_loops)
+    cache.add_strands(visit, bm, twists, signatures)
+    return removed_splines, visit
+
+
+def update_bezier_splines(curve, bm, twists, settings, cache, signatures):
+    """Patches a curve made from the cached knot to match the edited mesh bm,
+    removing the splines of strands near edits and adding splines for the strands that replace them.
+    Returns the number of strands removed and added."""
+    removed_splines, visit = update_cached_strands(cache, bm, twists, signatures)
+    for i in sorted(removed_splines, reverse=True):
+        curve.splines.remove(curve.splines[i])
+    first_new = len(curve.splines)
+    builder = BezierBuilder(bm, settings.crossing_angle, settings.crossing_strength, settings.handle_type,
+                            settings.weave_up, settings.weave_down, None, curve, keep_splines=True,
+                            midpoints=EdgeMidpoints(bm))
+    visit(bm, twists, builder)
+    # Finish the new splines like add_curve_object does
+    for spline in curve.splines[first_new:]:
+        points = spline.bezier_points
+        for point in points:
+            point.handle_left_type = settings.handle_type
+            point.handle_right_type = settings.handle_type
+        points.foreach_set("radius", [1.0] * len(points))
+    curve.update_tag()
+    return len(removed_splines), len(curve.splines) - first_new
+
+
+## Vector export (writing knots on flat framework meshes as SVG paths or G-code, strand by strand)
+
+VECTOR_FORMATS = [("SVG", "SVG", "Paths for printing and vector editors"),
+                  ("GCODE", "G-code", "Straight moves for laser cutters and plotters")]
+VECTOR_EXTENSIONS = {"SVG": ".svg", "GCODE": ".gcode"}
+
+
+def get_plane_axes(co, loop_verts, face_starts, face_sizes):
+    """Finds the plane best fitting the vertex positions co, returning a point on it and two unit axes along it,
+    oriented so the faces are seen from the front (the side weave_up shifts strands towards)."""
+    origin = co.mean(axis=0)
+    axes = np.linalg.svd(co - origin, full_matrices=False)[2][:2]
+    # Newell's method, summed over every face
+    next_loops = np.arange(1, len(loop_verts) + 1)
+    next_loops[face_starts + face_sizes - 1] = face_starts
+    normal = np.cross(co[loop_verts], co[loop_verts[next_loops]]).sum(axis=0)
+    if np.dot(np.cross(axes[0], axes[1]), normal) < 0:
+        axes[1] *= -1
+    return origin, axes
+
+
+def get_under_points(geometry):
+    """Finds which points of a StrandGeometry pass under another strand (the ones get_offset shifts by weave_down)."""
+    crossing = np.isin(geometry.twists, (TWIST_CW, TWIST_CCW))
+    return crossing & ((geometry.twists == TWIST_CW) == geometry.forwards)
+
+
+def blossom(p0, p1, p2, p3, u, v, w):
+    """Evaluates the polar form of cubic beziers, like de Casteljau's algorithm but with a different t per level.
+    blossom(..., t, t, t) is the point at t, and the control points of the part between a and b are
+    the blossoms at (a, a, a), (a, a, b), (a, b, b) and (b, b, b)."""
+    u, v, w = u[:, None], v[:, None], w[:, None]
+    q0, q1, q2 = lerp(p0, p1, u), lerp(p1, p2, u), lerp(p2, p3, u)
+    return lerp(lerp(q0, q1, v), lerp(q1, q2, v), w)
+
+
+def get_plane_curves(result, origin, axes):
+    """Projects the splines computed by compute_knot onto a plane,
+    returning the 2D points, right handles and left handles."""
+    to_plane = lambda v: (v.astype(np.float64) - origin) @ axes.T
+    return to_plane(result["points"]), to_plane(result["handle_rights"]), to_plane(result["handle_lefts"])
+
+
+def get_vector_segments(curves, next_parts, under, start, end, gap):
+    """Trims the projected splines from get_plane_curves where they pass under others, for the points start to end
+    (usually one strand, so the segments of the whole knot are never all held at once).
+    Returns an array of the four 2D control points of each segment (running from each point to the next
+    along its strand).
+    gap is the proportion of the segments either side of an under crossing that is left out."""
+    points, handle_rights, handle_lefts = curves
+    parts = np.arange(start, end)
+    nexts = next_parts[parts]
+    t0 = np.where(under[parts], gap, 0.0)
+    t1 = np.where(under[nexts], 1 - gap, 1.0)
+    curve = (points[parts], handle_rights[parts], handle_lefts[nexts], points[nexts])
+    return np.stack((blossom(*curve, t0, t0, t0),
+                     blossom(*curve, t0, t0, t1),
+                     blossom(*curve, t0, t1, t1),
+                     blossom(*curve, t1, t1, t1)), axis=1)
+
+
+def get_strand_pieces(segments, under):
+    """Splits the segments of a strand into the pieces between its under crossings.
+    Yields an array of segments for each piece, and whether it is closed."""
+    unders = np.flatnonzero(under).tolist()
+    if not unders:
+        yield segments, True
+        return
+    # Segment i starts at point i, so each piece starts at the segment after an under crossing
+    for start, end in cyclic_zip(unders):
+        if start < end:
+            yield segments[start:end], False
+        else:
+            yield np.concatenate((segments[start:], segments[:end])), False
+
+
+def sample_segments(segments, samples):
+    """Approximates segments by samples straight lines each, returning the points after the first."""
+    t = np.tile(np.arange(1, samples + 1) / samples, len(segments))
+    p0, p1, p2, p3 = (np.repeat(segments[:, i], samples, axis=0) for i in range(4))
+    return blossom(p0, p1, p2, p3, t, t, t)
+
+
+def write_svg(file, strands, size, settings):
+    """Writes strands (an iterable of lists of pieces from get_strand_pieces) as one SVG path each."""
+    width, height = size
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+               '<svg xmlns="http://www.w3.org/2000/svg" width="{0:.3f}mm" height="{1:.3f}mm" '
+               'viewBox="0 0 {0:.3f} {1:.3f}">\n'
+               '<g fill="none" stroke="black" stroke-width="{2:.3f}" stroke-linecap="round">\n'
+               .format(width, height, settings.line_width))
+    flip = np.array([1, -1])
+    offset = np.array([0, height])
+    for pieces in strands:
+        commands = []
+        for segments, closed in pieces:
+            # SVG's y axis points down
+            segments = segments * flip + offset
+            commands.append("M{:.3f},{:.3f}".format(*segments[0, 0]))
+            commands.extend("C{:.3f},{:.3f} {:.3f},{:.3f} {:.3f},{:.3f}".format(*segment[1:].ravel())
+                            for segment in segments)
+            if closed:
+                commands.append("Z")
+        file.write('<path d="{}"/>\n'.format(" ".join(commands)))
+    file.write("</g>\n</svg>\n")
+
+
+def write_gcode(file, strands, settings):
+    """Writes strands (an iterable of lists of pieces from get_strand_pieces) as G-code,
+    turning the laser (or pen) on with M3 and off with M5 around each piece."""
+    file.write("G21\nG90\nM5\n")
+    for pieces in strands:
+        lines = []
+        for segments, closed in pieces:
+            lines.append("G0 X{:.3f} Y{:.3f}".format(*segments[0, 0]))
+            lines.append("M3 S{:g}".format(settings.power))
+            lines.append("G1 F{:g}".format(settings.feed_rate))
+            lines.extend("G1 X{:.3f} Y{:.3f}".format(*point)
+                         for point in sample_segments(segments, settings.curve_samples))
+            lines.append("M5")
+        file.write("\n".join(lines) + "\n")
+    file.write("G0 X0 Y0\nM2\n")
+
+
+def export_knot_vectors(file, knot_input, settings):
+    """Computes a knot as compute_knot does, and writes it to the text file as 2D vectors.
+    Only the bezier settings are used, along with vector_format (from VECTOR_FORMATS),
+    gap (proportion of the segments cut either side of crossing under another strand),
+    scale (output units, millimetres, per mesh unit), line_width for SVG,
+    and power, feed_rate and curve_samples (lines per bezier segment) for G-code.
+    Strands are trimmed and written one at a time, so neither their segments nor the file contents
+    are ever all held in memory (though the mesh and the points of the knot are)."""
+    settings = SimpleNamespace(**vars(settings))
+    settings.output_type = BEZIER
+    settings.coloring_type = "NONE"
+    result = compute_knot(knot_input, settings)
+    origin, axes = get_plane_axes(knot_input["co"], knot_input["loop_verts"],
+                                  knot_input["face_starts"], knot_input["face_sizes"])
+    curves = get_plane_curves(result, origin, axes)
+    geometry = result["geometry"]
+    under = get_under_points(geometry)
+    starts = result["strand_starts"].tolist()
+    ends = starts[1:] + [len(under)]
+    strand_segments = lambda: ((start, end, get_vector_segments(curves, geometry.next_parts, under,
+                                                                start, end, settings.gap))
+                               for start, end in zip(starts, ends))
+    # Move the bounds of the control points (which contain the curves) to the origin, in output units,
+    # finding them in a first pass so the segments are still only made one strand at a time
+    margin = settings.line_width if settings.vector_format == "SVG" else 0
+    low = np.full(2, np.inf)
+    high = np.full(2, -np.inf)
+    for _, _, segments in strand_segments():
+        control_points = segments.reshape(-1, 2)
+        low = np.minimum(low, control_points.min(axis=0))
+        high = np.maximum(high, control_points.max(axis=0))
+    if not starts:
+        low = high = np.zeros(2)
+    size = (high - low) * settings.scale + 2 * margin
+    strands = (list(get_strand_pieces((segments - low) * settings.scale + margin, under[start:end]))
+               for start, end, segments in strand_segments())
+    if settings.vector_format == "SVG":
+        write_svg(file, strands, size, settings)
+    else:
+        write_gcode(file, strands, settings)
+
+
+def read_obj_input(path):
+    """Reads the vertices and faces of a Wavefront OBJ file into the arrays read_knot_input would give,
+    for exporting knots without Blender."""
+    vertices = []
+    faces = []
+    with open(path) as file:
+        for line in file:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == "v":
+                vertices.append([float(x) for x in words[1:4]])
+            elif words[0] == "f":
+                # Indices may be negative (relative to the end) and followed by texture and normal indices
+                indices = (int(word.split("/")[0]) for word in words[1:])
+                faces.append([i - 1 if i > 0 else len(vertices) + i for i in indices])
+    mesh = PyMesh(vertices, faces)
+    face_sizes = np.array([len(face) for face in faces], dtype=np.intc)
+    return {
+        "co": mesh.co,
+        "edges": get_edge_verts(mesh),
+        "loop_verts": np.array([v for face in faces for v in face], dtype=np.intc),
+        "face_starts": (np.cumsum(face_sizes) - face_sizes).astype(np.intc),
+        "face_sizes": face_sizes,
+    }
+
+
+def export_obj_knot(args=None):
+    """Exports the knot of an OBJ file as SVG or G-code from the command line, without Blender."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Exports the celtic knot woven over a flat mesh.")
+    parser.add_argument("input", help="Wavefront OBJ framework mesh")
+    parser.add_argument("output", help="SVG or G-code file to write, chosen by its extension")
+    parser.add_argument("--remesh-type", default="NONE", choices=[t[0] for t in REMESH_TYPES])
+    parser.add_argument("--weave-type", default="CELTIC", choices=["CELTIC", "TWILL"])
+    parser.add_argument("--twist-proportion", type=float, default=100.0)
+    parser.add_argument("--gap", type=float, default=0.2)
+    parser.add_argument("--scale", type=float, default=1000.0,
+                        help="millimetres per mesh unit (by default, mesh units are metres as in Blender)")
+    parser.add_argument("--line-width", type=float, default=0.5)
+    parser.add_argument("--power", type=float, default=1000)
+    parser.add_argument("--feed-rate", type=float, default=1000)
+    parser.add_argument("--curve-samples", type=int, default=8)
+    options = parser.parse_args(args)
+    settings = SimpleNamespace(
+        remesh_type=options.remesh_type, weave_type=options.weave_type, twist_proportion=options.twist_proportion,
+        refine_iterations=0, refine_time=0, weave_up=0, weave_down=0, handle_type="AUTO",
+        crossing_angle=pi / 4, crossing_strength=0,
+        vector_format="GCODE" if options.output.lower().endswith((".gcode", ".nc")) else "SVG",
+        gap=options.gap, scale=options.scale, line_width=options.line_width,
+        power=options.power, feed_rate=options.feed_rate, curve_samples=options.curve_samples)
+    with open(options.output, "w") as file:
+        export_knot_vectors(file, read_obj_input(options.input), settings)
+
+
+class CelticKnotSettings:
+    """The properties, drawing and output creation shared by the knot operators."""
+    # Whether the operator can split its output into tiles, or overwrite an existing object
+    use_tiles = True
+    use_target = True
 
     remesh_type: bpy.props.EnumProperty(items=REMESH_TYPES,
                                          name="Remesh Type",
@@ -785,7 +2526,8 @@ class CelticKnotOperator(bpy.types.Operator):
                                          default="NONE")
 
     weave_types = [("CELTIC","Celtic","All crossings use same orientation"),
-                   ("TWILL","Twill","Over two then under two")]
+                   ("TWILL","Twill","Over two then under two"),
+                   ("STORED","Stored","Use twists stored in the " + TWIST_ATTRIBUTE + " edge attribute")]
     weave_type: bpy.props.EnumProperty(items=weave_types,
                                          name="Weave Type",
                                          description="Determines which crossings are over or under",
@@ -806,6 +2548,20 @@ class CelticKnotOperator(bpy.types.Operator):
                                                default=100.0,
                                                min=0.0,
                                                max=100.0)
+    refine_iterations: bpy.props.IntProperty(name="Refine Iterations",
+                                              description="Twill only: maximum number of edge flips tried to fix the weave (zero disables)",
+                                              default=0,
+                                              min=0)
+    refine_time: bpy.props.FloatProperty(name="Refine Time",
+                                          description="Twill only: maximum seconds spent refining the weave (zero for no limit)",
+                                          default=5.0,
+                                          min=0.0)
+    twist_weights: bpy.props.StringProperty(name="Twist Weights",
+                                             description="Vertex group or attribute scaling the twist proportion per edge "
+                                                         "(a float point attribute is much faster to read on huge meshes)")
+    store_twists: bpy.props.BoolProperty(name="Store Twists",
+                                          description="Save the twists as an edge attribute of the framework mesh, for later editing",
+                                          default=False)
     output_types = [(BEZIER, "Bezier", "Bezier curve"),
                     (PIPE, "Pipe", "Rounded solid mesh"),
                     (RIBBON, "Ribbon", "Flat plane mesh")]
@@ -852,11 +2608,28 @@ class CelticKnotOperator(bpy.types.Operator):
                                       soft_max=100.0)
     coloring_types = [("NONE", "None", "No colors"),
                       ("STRAND", "Per strand", "Assign a unique material to every strand."),
-                      ("BRAID", "Per braid", "Use as few materials as possible while preserving crossings.")]
+                      ("BRAID", "Per braid", "Use as few materials as possible while preserving crossings."),
+                      ("ATTRIBUTE", "Attributes", "Ribbon only: store strand, braid and position along strand as attributes, "
+                                                  "shown by a single shared material.")]
     coloring_type: bpy.props.EnumProperty(items=coloring_types,
                                          name="Coloring",
                                          description="Controls what materials are assigned to the created object",
                                          default="NONE")
+    tile_size: bpy.props.FloatProperty(name="Tile Size",
+                                        description="Split the output into one object per grid cell of this size (zero disables)",
+                                        default=0,
+                                        min=0,
+                                        subtype="DISTANCE",
+                                        unit="LENGTH")
+    target_object: bpy.props.StringProperty(name="Update Object",
+                                             description="Overwrite the data of this existing knot object, "
+                                                         "instead of creating a new one")
+    follow_deformation: bpy.props.BoolProperty(name="Follow Deformation",
+                                                description="Update the knot on frame changes as the framework mesh deforms, "
+                                                            "without regenerating it (Bezier and Ribbon only). "
+                                                            "When the file is loaded again, the knot is regenerated "
+                                                            "from the framework mesh to resume following it",
+                                                default=False)
 
     def draw(self, context):
         layout = self.layout
@@ -864,6 +2637,13 @@ class CelticKnotOperator(bpy.types.Operator):
         layout.prop(self, "weave_type")
         if self.weave_type == "CELTIC":
             layout.prop(self, "twist_proportion")
+            layout.prop(self, "twist_weights")
+        elif self.weave_type == "TWILL" and self.remesh_type != "MEDIAL":
+            layout.prop(self, "refine_iterations")
+            if self.refine_iterations > 0:
+                layout.prop(self, "refine_time")
+        if self.remesh_type == "NONE":
+            layout.prop(self, "store_twists")
         layout.prop(self, "output_type")
         layout.prop(self, "weave_up")
         layout.prop(self, "weave_down")
@@ -878,6 +2658,12 @@ class CelticKnotOperator(bpy.types.Operator):
         if self.output_type == PIPE:
             layout.prop(self, "thickness")
         layout.prop(self, "coloring_type")
+        if self.use_tiles:
+            layout.prop(self, "tile_size")
+        if self.tile_size == 0 and self.use_target:
+            layout.prop_search(self, "target_object", context.scene, "objects")
+        if self.tile_size == 0 and not (self.output_type == PIPE and self.thickness > 0):
+            layout.prop(self, "follow_deformation")
 
     @classmethod
     def poll(cls, context):
@@ -887,8 +2673,92 @@ class CelticKnotOperator(bpy.types.Operator):
                 (ob.type == "MESH") and
                 (context.mode == "OBJECT"))
 
+    def get_target(self, context, source):
+        """Finds the object to overwrite, if any.
+        Returns False if it is not suitable for the current settings."""
+        if not self.target_object:
+            return None
+        target = context.scene.objects.get(self.target_object)
+        if target is None or target == source or self.tile_size > 0:
+            return False
+        thick_pipe = self.output_type == PIPE and self.thickness > 0
+        if target.type != ("MESH" if self.output_type == RIBBON or thick_pipe else "CURVE"):
+            return False
+        return target
+
+    def get_settings(self):
+        """Copies the properties, so they can be read away from the main thread."""
+        return SimpleNamespace(**{name: getattr(self, name) for name in CelticKnotSettings.__annotations__})
+
+    def follow(self, context, obj, output_obj, orig_edge_verts, orig_vert_count, geometry):
+        """Keeps the strands, so later frames only need to recompute positions."""
+        animation = new_knot_animation(obj.name, output_obj.name, self,
+                                       orig_edge_verts, orig_vert_count, geometry)
+        add_knot_animation(animation, output_obj, self.get_settings())
+        animation.update(context.evaluated_depsgraph_get())
+
+    def create_output(self, context, obj, result, target):
+        """Creates the output of compute_knot. Must be called on the main thread."""
+        if self.store_twists and self.remesh_type == "NONE":
+            store_twists(obj.data, result["twists"])
+        if target:
+            knot_caches.pop(target.name, None)
+            remove_knot_animation(target)
+        output_obj = create_knot_output(context, result, self, target)
+        if self.follow_deformation:
+            if self.output_type == PIPE and self.thickness > 0:
+                self.report({'WARNING'}, "Follow Deformation is not supported for pipes")
+            else:
+                self.follow(context, obj, output_obj,
+                            result["orig_edge_verts"], result["orig_vert_count"], result["geometry"])
+        return output_obj
+
+
+class CelticKnotOperator(CelticKnotSettings, bpy.types.Operator):
+    bl_idname = "object.celtic_knot_operator"
+    bl_label = "Celtic Knot"
+    bl_options = {'REGISTER', 'UNDO', 'PRESET'}
+
+    incremental: bpy.props.BoolProperty(name="Incremental",
+                                         description="Remember the knot, so that updating it after editing the framework "
+                                                     "mesh only regenerates strands near the edits (Bezier without coloring only)",
+                                         default=False)
+
+    def draw(self, context):
+        super().draw(context)
+        if self.supports_incremental():
+            self.layout.prop(self, "incremental")
+
+    def supports_incremental(self):
+        return (self.output_type == BEZIER and self.coloring_type == "NONE" and
+                self.tile_size == 0 and not self.follow_deformation)
+
+    def get_cache_key(self, obj):
+        """The settings that must match for an incremental update."""
+        return (obj.name, self.remesh_type, self.weave_type, self.twist_proportion, self.twist_weights,
+                self.refine_iterations, self.refine_time, self.handle_type, self.crossing_angle,
+                self.crossing_strength, self.weave_up, self.weave_down)
+
+    def get_cache(self, obj, target):
+        """Finds the cache of target, if it can be updated incrementally."""
+        if not (self.incremental and self.supports_incremental() and target):
+            return None
+        cache = knot_caches.get(target.name)
+        if cache is None or cache.settings_key != self.get_cache_key(obj):
+            return None
+        # Check the curve hasn't changed since (e.g. by undo)
+        splines = target.data.splines
+        if (len(splines) != len(cache.spline_strands) or
+                sum(len(spline.bezier_points) for spline in splines) != cache.point_count):
+            return None
+        return cache
+
     def execute(self, context):
         obj = context.active_object
+        target = self.get_target(context, obj)
+        if target is False:
+            self.report({'ERROR'}, "Cannot update " + self.target_object + " with the current settings")
+            return {'CANCELLED'}
         orig_bm = bm = bmesh.new()
         bm.from_mesh(obj.data)
 
@@ -896,49 +2766,344 @@ class CelticKnotOperator(bpy.types.Operator):
         bm = remesh(bm, self.remesh_type)
 
         # Compute twists
+        weights = None
         if self.weave_type == "CELTIC":
-            twists = get_celtic_twists(bm, self.twist_proportion / 100)
+            weights = get_vertex_weights(obj, self.twist_weights)
+            if weights is not None:
+                weights = remesh_vertex_values(get_edge_verts(orig_bm), weights, self.remesh_type)
+        stored_twists = load_twists(obj.data) if self.weave_type == "STORED" else None
+        cache = self.get_cache(obj, target)
+        if target:
+            # Until it follows deformation again, if it still should
+            remove_knot_animation(target)
+        if target and cache is None:
+            # The target is about to be overwritten, so whatever it cached is stale
+            knot_caches.pop(target.name, None)
+        if cache is not None:
+            signatures = get_edge_signatures(bm)
+            twists = update_twists(bm, self, len(orig_bm.faces), signatures, cache, weights, stored_twists)
         else:
-            if self.remesh_type == "MEDIAL":
-                twists = get_medial_twill_twists(bm, len(orig_bm.faces))
-            else:
-                twists = get_twill_twists(bm)
+            twists = get_twists(bm, self, len(orig_bm.faces), weights, stored_twists)
+        if twists is None:
+            self.report({'ERROR'}, NO_STORED_TWISTS)
+            return {'CANCELLED'}
+
+        if self.store_twists and self.remesh_type == "NONE":
+            store_twists(obj.data, twists)
+
+        # Only patch the strands near edits, if possible
+        if cache is not None:
+            removed, added = update_bezier_splines(target.data, bm, twists, self, cache, signatures)
+            self.report({'INFO'}, "Replaced {} strands with {}".format(removed, added))
+            return {'FINISHED'}
+
+        # Find the strands once, then replay them into each builder
+        table = get_strand_table(bm, twists)
+        loop_lookup = get_loop_lookup(bm)
+        visit_all = partial(visit_strand_runs, table=table, runs=table.strand_runs(), loop_lookup=loop_lookup)
 
         # Assign materials to strand parts
-        strand_analysis = StrandAnalysisBuilder()
+        strand_analysis = StrandAnalysisBuilder(bm)
         has_analysis = False
 
         def get_analysis():
             nonlocal has_analysis
             if not has_analysis:
-                visit_strands(bm, twists, strand_analysis)
+                visit_all(bm, twists, strand_analysis)
                 has_analysis = True
             return strand_analysis
 
+        attributes = False
         if self.coloring_type == "NONE":
             materials = None
+        elif self.coloring_type == "ATTRIBUTE" and self.output_type == RIBBON:
+            materials = None
+            attributes = True
         else:
+            # Attributes can only be stored on meshes, so curves fall back to braids
             if self.coloring_type == "STRAND":
                 materials = get_analysis().get_strands()
             else:
                 materials = get_analysis().get_braids()
 
+        # Split strands into one set of runs per tile, if desired
+        if self.tile_size > 0:
+            tile_runs = get_tile_runs(table, loop_lookup, get_face_tiles(bm, self.tile_size))
+            visitors = [partial(visit_strand_runs, table=table, runs=runs, loop_lookup=loop_lookup)
+                        for tile, runs in sorted(tile_runs.items())]
+            # Shared by every tile, rather than recomputed for each
+            midpoints = get_edge_midpoints(bm) if self.output_type in (BEZIER, PIPE) else None
+        else:
+            visitors = [visit_all]
+            midpoints = None
+
         # Build a mesh (or curve) object from the above
-        if self.output_type in (BEZIER, PIPE):
-            curve_obj = create_bezier(context, bm, twists,
-                                      self.crossing_angle,
-                                      self.crossing_strength,
-                                      self.handle_type,
-                                      self.weave_up,
-                                      self.weave_down,
-                                      materials)
-
-            # If thick, then give it a bevel_object and convert to mesh
-            if self.output_type == PIPE and self.thickness > 0:
-                create_pipe_from_bezier(context, curve_obj, self.thickness)
+        for visit in visitors:
+            if self.output_type in (BEZIER, PIPE):
+                curve_obj = create_bezier(context, bm, twists,
+                                          self.crossing_angle,
+                                          self.crossing_strength,
+                                          self.handle_type,
+                                          self.weave_up,
+                                          self.weave_down,
+                                          materials,
+                                          visit,
+                                          target if self.output_type == BEZIER or self.thickness == 0 else None,
+                                          midpoints)
+                output_obj = curve_obj
+
+                # If thick, then give it a bevel and convert to mesh
+                if self.output_type == PIPE and self.thickness > 0:
+                    create_pipe_from_bezier(context, curve_obj, self.thickness, target)
+                    output_obj = None
+            else:
+                output_obj = create_ribbon(context, bm, twists, self.weave_up, self.weave_down,
+                                           self.length / 100, self.breadth / 100,
+                                           get_analysis(), materials, visit, attributes, target,
+                                           shared_ends=self.tile_size > 0)
+
+        # Keep the strands, so later frames only need to recompute positions
+        if self.follow_deformation:
+            if self.tile_size > 0 or output_obj is None:
+                self.report({'WARNING'}, "Follow Deformation is not supported for tiles or pipes")
+            else:
+                self.follow(context, obj, output_obj, get_edge_verts(orig_bm), len(orig_bm.verts),
+                            StrandGeometry(MeshTopology(bm), table, twists))
+
+        # Remember the strands, so the next update can be incremental
+        if self.incremental and self.supports_incremental():
+            signatures = get_edge_signatures(bm)
+            cache = KnotCache(self.get_cache_key(obj), dict(zip(signatures, twists.tolist())))
+            cache.add_strands(visit_all, bm, twists, signatures)
+            knot_caches[output_obj.name] = cache
+        return {'FINISHED'}
+
+
+class CelticKnotModalOperator(CelticKnotSettings, bpy.types.Operator):
+    """Generate a celtic knot in the background, so Blender stays responsive. Press Esc to cancel"""
+    bl_idname = "object.celtic_knot_modal_operator"
+    bl_label = "Celtic Knot (Background)"
+    bl_options = {'REGISTER', 'UNDO', 'PRESET'}
+    use_tiles = False
+
+    def execute(self, context):
+        # Used when redoing, there is no need to stay responsive then
+        obj = context.active_object
+        target = self.get_target(context, obj)
+        if target is False:
+            self.report({'ERROR'}, "Cannot update " + self.target_object + " with the current settings")
+            return {'CANCELLED'}
+        try:
+            result = compute_knot(read_knot_input(obj, self), self.get_settings())
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        self.create_output(context, obj, result, target)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        obj = context.active_object
+        if self.tile_size > 0:
+            self.report({'WARNING'}, "Tiles are not supported in the background, ignoring Tile Size")
+            self.tile_size = 0
+        if self.get_target(context, obj) is False:
+            self.report({'ERROR'}, "Cannot update " + self.target_object + " with the current settings")
+            return {'CANCELLED'}
+        # Everything the job needs is read now, so it never touches bpy
+        self.source_name = obj.name
+        self.source_counts = self.get_mesh_counts(obj)
+        self.job = KnotJob(read_knot_input(obj, self), self.get_settings())
+        self.job.start()
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.1, window=context.window)
+        wm.progress_begin(0, len(KNOT_STAGES))
+        wm.modal_handler_add(self)
+        self.show_progress(context)
+        return {'RUNNING_MODAL'}
+
+    def get_mesh_counts(self, obj):
+        """The sizes of the mesh, which the result of the job must match to be stored on it."""
+        mesh = obj.data
+        return len(mesh.vertices), len(mesh.edges), len(mesh.polygons)
+
+    def show_progress(self, context):
+        stage = self.job.stage
+        context.window_manager.progress_update(stage)
+        context.workspace.status_text_set("Celtic Knot: {} ({}/{}), Esc to cancel".format(
+            KNOT_STAGES[stage], stage + 1, len(KNOT_STAGES)))
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+    def modal(self, context, event):
+        job = self.job
+        if event.type == 'ESC':
+            # The job stops at the start of its next stage
+            job.cancelled = True
+            self.finish(context)
+            self.report({'INFO'}, "Celtic Knot cancelled")
+            return {'CANCELLED'}
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        if job.is_alive():
+            self.show_progress(context)
+            return {'PASS_THROUGH'}
+        self.finish(context)
+        if job.error is not None:
+            self.report({'ERROR'}, str(job.error))
+            return {'CANCELLED'}
+        # The scene may have changed while the job ran
+        obj = context.scene.objects.get(self.source_name)
+        target = self.get_target(context, obj)
+        if obj is None or target is False:
+            self.report({'ERROR'}, "Celtic Knot objects were changed before it finished")
+            return {'CANCELLED'}
+        # Twists are stored per edge of the mesh, so it must not have been edited either
+        if obj.type != "MESH" or self.get_mesh_counts(obj) != self.source_counts:
+            self.report({'ERROR'}, "Celtic Knot source mesh was edited before it finished")
+            return {'CANCELLED'}
+        self.create_output(context, obj, job.result, target)
+        return {'FINISHED'}
+
+
+class CelticKnotBatchOperator(CelticKnotSettings, bpy.types.Operator):
+    """Generate a celtic knot for every selected mesh, computing them in parallel"""
+    bl_idname = "object.celtic_knot_batch_operator"
+    bl_label = "Celtic Knot (Selected Objects)"
+    bl_options = {'REGISTER', 'UNDO', 'PRESET'}
+    use_tiles = False
+    use_target = False
+
+    processes: bpy.props.IntProperty(name="Processes",
+                                      description="Number of worker processes computing knots (zero for one per CPU)",
+                                      default=0,
+                                      min=0)
+
+    def draw(self, context):
+        super().draw(context)
+        self.layout.prop(self, "processes")
+
+    @classmethod
+    def poll(cls, context):
+        return (context.mode == "OBJECT" and
+                any(ob.type == "MESH" for ob in context.selected_objects))
+
+    def execute(self, context):
+        objs = [ob for ob in context.selected_objects if ob.type == "MESH"]
+        # Read everything up front, so the workers never need blender
+        knot_inputs = [read_knot_input(obj, self) for obj in objs]
+        results = compute_knots(knot_inputs, self.get_settings(), self.processes)
+        outputs = []
+        for obj, result in zip(objs, results):
+            if isinstance(result, Exception):
+                self.report({'WARNING'}, "Celtic Knot failed for {}: {}".format(obj.name, result))
+                continue
+            output_obj = self.create_output(context, obj, result, None)
+            # Keep each knot with its framework, rather than at the cursor
+            output_obj.matrix_world = obj.matrix_world
+            outputs.append(output_obj)
+        for output_obj in outputs:
+            output_obj.select_set(True)
+        return {'FINISHED'}
+
+
+class CelticKnotExportOperator(CelticKnotSettings, bpy.types.Operator, ExportHelper):
+    """Export the celtic knot of the active mesh as SVG paths or G-code, flattened onto the plane of the mesh"""
+    bl_idname = "export_curve.celtic_knot"
+    bl_label = "Export Celtic Knot"
+    use_tiles = False
+    use_target = False
+
+    filename_ext = ".svg"
+    filter_glob: bpy.props.StringProperty(default="*.svg;*.gcode", options={'HIDDEN'})
+
+    vector_format: bpy.props.EnumProperty(items=VECTOR_FORMATS,
+                                           name="Format",
+                                           description="Type of file to write",
+                                           default="SVG")
+    gap: bpy.props.FloatProperty(name="Gap",
+                                  description="Percent of the curve either side of a crossing left out of the strand passing under",
+                                  subtype="PERCENTAGE",
+                                  default=20,
+                                  min=0.0,
+                                  max=50.0)
+    scale: bpy.props.FloatProperty(name="Scale",
+                                    description="Millimetres in the file per unit of the mesh",
+                                    default=1000,
+                                    min=0.0)
+    line_width: bpy.props.FloatProperty(name="Line Width",
+                                         description="SVG only: stroke width in millimetres",
+                                         default=0.5,
+                                         min=0.0)
+    power: bpy.props.FloatProperty(name="Power",
+                                    description="G-code only: spindle or laser power while cutting",
+                                    default=1000,
+                                    min=0.0)
+    feed_rate: bpy.props.FloatProperty(name="Feed Rate",
+                                        description="G-code only: cutting speed in millimetres per minute",
+                                        default=1000,
+                                        min=0.0)
+    curve_samples: bpy.props.IntProperty(name="Curve Samples",
+                                          description="G-code only: number of straight moves per bezier segment",
+                                          default=8,
+                                          min=1)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "vector_format")
+        layout.prop(self, "remesh_type")
+        layout.prop(self, "weave_type")
+        if self.weave_type == "CELTIC":
+            layout.prop(self, "twist_proportion")
+            layout.prop(self, "twist_weights")
+        elif self.weave_type == "TWILL" and self.remesh_type != "MEDIAL":
+            layout.prop(self, "refine_iterations")
+            if self.refine_iterations > 0:
+                layout.prop(self, "refine_time")
+        layout.prop(self, "handle_type")
+        if self.handle_type != "AUTO":
+            layout.prop(self, "crossing_angle")
+            layout.prop(self, "crossing_strength")
+        layout.prop(self, "gap")
+        layout.prop(self, "scale")
+        if self.vector_format == "SVG":
+            layout.prop(self, "line_width")
         else:
-            create_ribbon(context, bm, twists, self.weave_up, self.weave_down, self.length / 100, self.breadth / 100,
-                          get_analysis(), materials)
+            layout.prop(self, "power")
+            layout.prop(self, "feed_rate")
+            layout.prop(self, "curve_samples")
+
+    def check(self, context):
+        # Keep the extension matching the format
+        filepath = bpy.path.ensure_ext(os.path.splitext(self.filepath)[0], VECTOR_EXTENSIONS[self.vector_format])
+        if filepath != self.filepath:
+            self.filepath = filepath
+            return True
+        return False
+
+    def execute(self, context):
+        obj = context.active_object
+        knot_input = read_knot_input(obj, self)
+        # Export in world space, so the object's scale is kept
+        matrix = np.array(obj.matrix_world)
+        knot_input["co"] = knot_input["co"] @ matrix[:3, :3].T + matrix[:3, 3]
+        settings = self.get_settings()
+        settings.vector_format = self.vector_format
+        settings.gap = self.gap / 100
+        settings.scale = self.scale
+        settings.line_width = self.line_width
+        settings.power = self.power
+        settings.feed_rate = self.feed_rate
+        settings.curve_samples = self.curve_samples
+        try:
+            with open(self.filepath, "w") as file:
+                export_knot_vectors(file, knot_input, settings)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
         return {'FINISHED'}
 
 
@@ -968,24 +3133,53 @@ class GeometricRemeshOperator(bpy.types.Operator):
         bm.to_mesh(obj.data)
         return {'FINISHED'}
 
+
 def menu_func(self, context):
     self.layout.operator(CelticKnotOperator.bl_idname,
                          text="Celtic Knot From Mesh",
                          icon='PLUGIN')
+    self.layout.operator(CelticKnotModalOperator.bl_idname,
+                         text="Celtic Knot From Mesh (Background)",
+                         icon='PLUGIN')
+    self.layout.operator(CelticKnotBatchOperator.bl_idname,
+                         text="Celtic Knot From Selected Meshes",
+                         icon='PLUGIN')
+
+
+def menu_export_func(self, context):
+    self.layout.operator(CelticKnotExportOperator.bl_idname,
+                         text="Celtic Knot (.svg, .gcode)")
 
 
 def register():
     bpy.utils.register_class(CelticKnotOperator)
+    bpy.utils.register_class(CelticKnotModalOperator)
+    bpy.utils.register_class(CelticKnotBatchOperator)
+    bpy.utils.register_class(CelticKnotExportOperator)
     bpy.utils.register_class(GeometricRemeshOperator)
     bpy.types.VIEW3D_MT_curve_add.append(menu_func)
+    bpy.types.TOPBAR_MT_file_export.append(menu_export_func)
+    bpy.app.handlers.frame_change_post.append(update_knot_animations)
+    bpy.app.handlers.load_post.append(load_knot_animations)
 
 
 def unregister():
+    bpy.app.handlers.load_post.remove(load_knot_animations)
+    bpy.app.handlers.frame_change_post.remove(update_knot_animations)
+    knot_animations.clear()
+    knot_caches.clear()
+    bpy.types.TOPBAR_MT_file_export.remove(menu_export_func)
     bpy.types.VIEW3D_MT_curve_add.remove(menu_func)
     bpy.utils.unregister_class(GeometricRemeshOperator)
+    bpy.utils.unregister_class(CelticKnotExportOperator)
+    bpy.utils.unregister_class(CelticKnotBatchOperator)
+    bpy.utils.unregister_class(CelticKnotModalOperator)
     bpy.utils.unregister_class(CelticKnotOperator)
     
 
 
 if __name__ == "__main__":
-    register()
+    if not HAS_BLENDER:
+        export_obj_knot()
+    else:
+        register()
@@ -0,0 +1,500 @@
+"""Compares the fast paths of celtic-knot.py (arrays, background generation, incremental updates)
+with the reference builders they replace, on random meshes, and checks how they scale.
+Runs without Blender, using PyMesh."""
+import importlib.util
+import os
+from math import sqrt
+from random import Random
+from types import SimpleNamespace
+import timeit
+
+import numpy as np
+import pytest
+
+spec = importlib.util.spec_from_file_location(
+    "celtic_knot", os.path.join(os.path.dirname(__file__), os.pardir, "celtic-knot.py"))
+ck = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(ck)
+
+SEEDS = range(20)
+
+
+def random_mesh_data(rng, width, height, components=1, fins=0):
+    """Makes the vertices and faces of a random framework mesh: bumpy grids with holes, triangles and hexagons,
+    plus fins (extra faces on existing edges, which are non-manifold where the edge already had two faces)."""
+    vertices = []
+    faces = []
+    for component in range(components):
+        start = len(vertices)
+        for y in range(height + 1):
+            for x in range(width + 1):
+                vertices.append((component * (width + 2) + x + rng.uniform(-0.2, 0.2),
+                                 y + rng.uniform(-0.2, 0.2),
+                                 rng.uniform(-0.2, 0.2)))
+
+        def vert(x, y):
+            return start + y * (width + 1) + x
+
+        for y in range(height):
+            x = 0
+            while x < width:
+                a, b, c, d = vert(x, y), vert(x + 1, y), vert(x + 1, y + 1), vert(x, y + 1)
+                r = rng.random()
+                if r < 0.1:
+                    # Leave a hole
+                    pass
+                elif r < 0.2 and x + 1 < width:
+                    # Cover two cells with a hexagon
+                    faces.append([a, b, vert(x + 2, y), vert(x + 2, y + 1), c, d])
+                    x += 1
+                elif r < 0.4:
+                    faces.append([a, b, c])
+                    faces.append([a, c, d])
+                else:
+                    faces.append([a, b, c, d])
+                x += 1
+    for _ in range(fins):
+        a, b = faces[rng.randrange(len(faces))][:2]
+        vertices.append(tuple((p + q) / 2 + (0, 0, 1)[i] for i, (p, q) in enumerate(zip(vertices[a], vertices[b]))))
+        faces.append([b, a, len(vertices) - 1])
+    return vertices, faces
+
+
+def random_mesh(seed):
+    rng = Random(seed)
+    vertices, faces = random_mesh_data(rng, rng.randrange(2, 9), rng.randrange(1, 7),
+                                       components=rng.randrange(1, 3), fins=rng.choice((0, 0, 2)))
+    return ck.PyMesh(vertices, faces)
+
+
+def make_knot_input(mesh):
+    """The input read_knot_input would give for mesh."""
+    face_sizes = np.array([len(face.loops) for face in mesh.faces], dtype=np.intc)
+    return {
+        "co": mesh.co.copy(),
+        "edges": ck.get_edge_verts(mesh),
+        "loop_verts": np.array([loop.vert.index for face in mesh.faces for loop in face.loops], dtype=np.intc),
+        "face_starts": (np.cumsum(face_sizes) - face_sizes).astype(np.intc),
+        "face_sizes": face_sizes,
+    }
+
+
+def make_settings(**kwargs):
+    settings = SimpleNamespace(remesh_type="NONE", weave_type="CELTIC", twist_proportion=50,
+                               refine_iterations=0, refine_time=0, output_type=ck.BEZIER, coloring_type="NONE",
+                               handle_type="ALIGNED", crossing_angle=0.6, crossing_strength=0.3,
+                               weave_up=-0.1, weave_down=0.15, length=80, breadth=40)
+    settings.__dict__.update(kwargs)
+    return settings
+
+
+def canonical_cycle(items):
+    """Identifies a cyclic sequence whatever its start and direction."""
+    items = list(items)
+    rotations = []
+    for sequence in (items, items[::-1]):
+        rotations.extend(tuple(sequence[i:] + sequence[:i]) for i in range(len(sequence)))
+    return min(rotations)
+
+
+class FakeCurve:
+    """Records the splines BezierBuilder adds to a blender curve."""
+    class Points:
+        def __init__(self):
+            self.count = 1
+            self.values = {}
+
+        def add(self, count):
+            self.count += count
+
+        def foreach_set(self, name, values):
+            self.values[name] = np.array(values, dtype=np.float64).reshape(self.count, 3)
+
+    class Spline:
+        def __init__(self):
+            self.bezier_points = FakeCurve.Points()
+            self.use_cyclic_u = False
+            self.material_index = 0
+
+    class Splines(list):
+        def new(self, spline_type):
+            self.append(FakeCurve.Spline())
+            return self[-1]
+
+    def __init__(self):
+        self.splines = FakeCurve.Splines()
+
+
+def reference_auto_handles(points):
+    """Blender's automatic handles of a cyclic spline, one point at a time."""
+    lefts, rights = [], []
+    for i, point in enumerate(points):
+        dvec_a = point - points[i - 1]
+        dvec_b = points[(i + 1) % len(points)] - point
+        len_a = np.linalg.norm(dvec_a) or 1
+        len_b = np.linalg.norm(dvec_b) or 1
+        tangent = dvec_b / len_b + dvec_a / len_a
+        length = np.linalg.norm(tangent) * 2.5614
+        if length == 0:
+            lefts.append(point)
+            rights.append(point)
+        else:
+            lefts.append(point - tangent * len_a / length)
+            rights.append(point + tangent * len_b / length)
+    return np.array(lefts), np.array(rights)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("remesh_type", [t[0] for t in ck.REMESH_TYPES])
+def test_remesh_vertex_values(seed, remesh_type):
+    """remesh_vertex_values moves values like remeshing moves vertex positions."""
+    mesh = random_mesh(seed)
+    remeshed = ck.remesh(mesh, remesh_type)
+    expected = ck.remesh_vertex_values(ck.get_edge_verts(mesh), mesh.co, remesh_type)
+    assert np.allclose(remeshed.co, expected)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("remesh_type", [t[0] for t in ck.REMESH_TYPES])
+@pytest.mark.parametrize("weave", ["NONE", "HALF", "ALL", "TWILL"])
+def test_strand_tracing(seed, remesh_type, weave):
+    """get_strand_table finds the same strands as visit_strands,
+    and replaying it gives the same strand analysis."""
+    mesh = random_mesh(seed)
+    remeshed = ck.remesh(mesh, remesh_type)
+    if weave != "TWILL":
+        twists = ck.get_celtic_twists(remeshed, {"NONE": 0, "HALF": 0.5, "ALL": 1}[weave])
+    elif remesh_type == "MEDIAL":
+        twists = ck.get_medial_twill_twists(remeshed, len(mesh.faces))
+    else:
+        twists = ck.get_twill_twists(remeshed)
+    reference = ck.StrandTableBuilder()
+    ck.visit_strands(remeshed, twists, reference)
+    table = ck.get_strand_table(remeshed, twists)
+    for name in ("prev_loops", "loops", "forwards", "strand_starts"):
+        assert getattr(table, name) == getattr(reference, name), name
+
+    reference = ck.StrandAnalysisBuilder(remeshed)
+    ck.visit_strands(remeshed, twists, reference)
+    replayed = ck.StrandAnalysisBuilder(remeshed)
+    ck.visit_strand_runs(remeshed, twists, replayed, table, table.strand_runs(), ck.get_loop_lookup(remeshed))
+    assert np.array_equal(replayed.get_strands(), reference.get_strands())
+    assert np.array_equal(replayed.get_braids(), reference.get_braids())
+
+
+@pytest.mark.parametrize("output_type, coloring_type", [(ck.BEZIER, "BRAID"), (ck.RIBBON, "ATTRIBUTE")])
+def test_no_strands(output_type, coloring_type):
+    """A mesh whose edges are all on the boundary has loops but no strands."""
+    mesh = ck.PyMesh([(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)], [[0, 1, 2, 3]])
+    strand_analysis = ck.StrandAnalysisBuilder(mesh)
+    ck.visit_strands(mesh, ck.get_celtic_twists(mesh, 1), strand_analysis)
+    assert (strand_analysis.get_braids() == -1).all()
+    result = ck.compute_knot(make_knot_input(mesh), make_settings(output_type=output_type, coloring_type=coloring_type))
+    assert len(result["geometry"].loops) == 0
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("wire", [False, True])
+def test_twill_resume(seed, wire):
+    """Resuming the twill solver from a complete result changes nothing,
+    and refining keeps valid twists without violating more conditions (even with wire edges)."""
+    mesh = random_mesh(seed)
+    if wire:
+        # A loose edge, and one between vertices of the mesh (possibly across a face or hole)
+        rng = Random(seed)
+        vertices = np.concatenate((mesh.co, [(-1, -1, 0), (-2, -1, 0)]))
+        faces = [[loop.vert.index for loop in face.loops] for face in mesh.faces]
+        mesh = ck.PyMesh(vertices, faces, [(len(vertices) - 2, len(vertices) - 1),
+                                           tuple(rng.sample(range(len(mesh.co)), 2))])
+    twists = ck.get_twill_twists(mesh)
+    assert np.array_equal(ck.get_twill_twists(mesh, initial=twists), twists)
+    refined = ck.get_twill_twists(mesh, refine_iterations=100)
+    assert np.isin(refined, (ck.TWIST_CW, ck.TWIST_CCW, ck.IGNORE)).all()
+    assert ck.count_twill_violations(mesh, refined) <= ck.count_twill_violations(mesh, twists)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("weave_type", ["CELTIC", "TWILL"])
+def test_incremental(seed, weave_type):
+    """Updating a cached knot after random edits gives the same strands as tracing from scratch."""
+    rng = Random(seed)
+    settings = make_settings(weave_type=weave_type)
+    vertices, faces = random_mesh_data(rng, 8, 6)
+    mesh = ck.PyMesh(vertices, faces)
+    twists = ck.get_twists(mesh, settings, len(faces))
+    signatures = ck.get_edge_signatures(mesh)
+    cache = ck.KnotCache(None, dict(zip(signatures, twists.tolist())))
+    cache.add_strands(ck.visit_strands, mesh, twists, signatures)
+    # Move a vertex, and remove some faces
+    i = rng.randrange(len(vertices))
+    vertices[i] = (vertices[i][0], vertices[i][1], vertices[i][2] + 0.5)
+    faces = [face for face in faces if rng.random() > 0.05]
+    mesh = ck.PyMesh(vertices, faces)
+    signatures = ck.get_edge_signatures(mesh)
+    twists = ck.update_twists(mesh, settings, len(faces), signatures, cache)
+    ck.update_cached_strands(cache, mesh, twists, signatures)
+    reference = ck.KnotCache(None, {})
+    reference.add_strands(ck.visit_strands, mesh, twists, signatures)
+    assert (sorted(map(canonical_cycle, cache.strand_edges.values())) ==
+            sorted(map(canonical_cycle, reference.strand_edges.values())))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("remesh_type", [t[0] for t in ck.REMESH_TYPES])
+@pytest.mark.parametrize("handle_type", ["ALIGNED", "AUTO"])
+def test_bezier(seed, remesh_type, handle_type):
+    """compute_knot makes the same splines as BezierBuilder (with the handles blender would give auto points)."""
+    mesh = random_mesh(seed)
+    knot_input = make_knot_input(mesh)
+    settings = make_settings(remesh_type=remesh_type, handle_type=handle_type, coloring_type="BRAID")
+    result = ck.compute_knot(knot_input, settings)
+
+    remeshed = ck.remesh(ck.PyMesh(knot_input["co"], ck.get_input_faces(knot_input), knot_input["edges"]),
+                         remesh_type)
+    twists = result["twists"]
+    strand_analysis = ck.StrandAnalysisBuilder(remeshed)
+    ck.visit_strands(remeshed, twists, strand_analysis)
+    curve = FakeCurve()
+    builder = ck.BezierBuilder(remeshed, settings.crossing_angle, settings.crossing_strength, handle_type,
+                               settings.weave_up, settings.weave_down, strand_analysis.get_braids(),
+                               curve=curve, keep_splines=True)
+    ck.visit_strands(remeshed, twists, builder)
+
+    # Where two faces are folded back to back, the offset direction is rounding noise
+    geometry = result["geometry"]
+    loop_normals = ck.get_loop_normals(remeshed.co, geometry.topology)
+    folded = np.linalg.norm(loop_normals[geometry.loops] + loop_normals[geometry.prev_loops], axis=1) < 1e-6
+    starts = result["strand_starts"]
+    ends = np.append(starts[1:], len(result["points"]))
+    assert len(curve.splines) == len(starts)
+    for spline, start, end, material in zip(curve.splines, starts, ends, result["strand_materials"]):
+        assert spline.material_index == material
+        if folded[start:end].any():
+            continue
+        points = spline.bezier_points.values
+        assert np.allclose(result["points"][start:end], points["co"], atol=1e-5)
+        if handle_type == "AUTO":
+            handle_lefts, handle_rights = reference_auto_handles(points["co"])
+        else:
+            handle_lefts, handle_rights = points["handle_left"], points["handle_right"]
+        assert np.allclose(result["handle_lefts"][start:end], handle_lefts, atol=1e-5)
+        assert np.allclose(result["handle_rights"][start:end], handle_rights, atol=1e-5)
+
+
+def get_face_keys(vertices, faces, uvs, *face_values):
+    """Describes each face by its corner positions and uvs and the given values, in a sorted list
+    (so that faces can be compared whatever order they were made in)."""
+    keys = []
+    corner = 0
+    for i, face in enumerate(faces):
+        keys.append((tuple(np.round(vertices[face], 4).ravel()),
+                     tuple(np.round(uvs[2 * corner:2 * (corner + len(face))], 4)))
+                    + tuple(values[i] for values in face_values))
+        corner += len(face)
+    return sorted(keys)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("remesh_type", [t[0] for t in ck.REMESH_TYPES])
+def test_ribbon(seed, remesh_type):
+    """compute_knot makes the same ribbon faces and attributes as RibbonBuilder.
+    The weave offsets are left out, as they are shared with the beziers (and are noise on folded faces)."""
+    mesh = random_mesh(seed)
+    knot_input = make_knot_input(mesh)
+    settings = make_settings(remesh_type=remesh_type, output_type=ck.RIBBON, coloring_type="ATTRIBUTE",
+                             weave_up=0, weave_down=0)
+    result = ck.compute_knot(knot_input, settings)
+
+    remeshed = ck.remesh(ck.PyMesh(knot_input["co"], ck.get_input_faces(knot_input), knot_input["edges"]),
+                         remesh_type)
+    twists = result["twists"]
+    strand_analysis = ck.StrandAnalysisBuilder(remeshed)
+    ck.visit_strands(remeshed, twists, strand_analysis)
+    builder = ck.RibbonBuilder(settings.weave_up, settings.weave_down, settings.length / 100,
+                               settings.breadth / 100, strand_analysis)
+    ck.visit_strands(remeshed, twists, builder)
+
+    face_parts = np.frombuffer(builder.face_parts, dtype=np.intc)
+    vertex_params = np.frombuffer(builder.vertex_params, dtype=np.float32)
+    expected = get_face_keys(np.array(builder.vertices), builder.faces, np.array(builder.uvs, dtype=np.float64),
+                             strand_analysis.get_strands()[face_parts], strand_analysis.get_braids()[face_parts],
+                             [tuple(np.round(vertex_params[face], 4)) for face in builder.faces])
+
+    face_ends = np.cumsum(result["face_sizes"])
+    faces = np.split(result["loop_verts"], face_ends[:-1]) if len(face_ends) else []
+    strands, braids, params = result["attributes"]
+    actual = get_face_keys(result["vertices"], faces, result["uvs"], strands, braids,
+                           [tuple(np.round(params[face], 4)) for face in faces])
+    assert len(actual) == len(expected)
+    # Even where non-manifold edges send several strands along the same directed loop
+    parts = result["geometry"].get_strand_parts()
+    assert len(np.unique(parts)) == len(parts)
+    for a, e in zip(actual, expected):
+        assert np.allclose(a[0], e[0], atol=1e-3) and np.allclose(a[1], e[1], atol=1e-3)
+        assert a[2:4] == e[2:4]
+        assert np.allclose(a[4], e[4], atol=1e-3)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_ribbon_tiles(seed):
+    """Splitting a ribbon into tiles makes the same faces (with the same uvs and positions along the strands)
+    as building it whole, each once, and every vertex is used."""
+    mesh = ck.remesh(random_mesh(seed), "EDGE_SUBDIVIDE")
+    twists = ck.get_celtic_twists(mesh, 0.5)
+    strand_analysis = ck.StrandAnalysisBuilder(mesh)
+    ck.visit_strands(mesh, twists, strand_analysis)
+    whole = ck.RibbonBuilder(0, 0, 0.8, 0.4, strand_analysis)
+    ck.visit_strands(mesh, twists, whole)
+    tiled = ck.RibbonBuilder(0, 0, 0.8, 0.4, strand_analysis, shared_ends=True)
+    table = ck.get_strand_table(mesh, twists)
+    loop_lookup = ck.get_loop_lookup(mesh)
+    for tile, runs in sorted(ck.get_tile_runs(table, loop_lookup, ck.get_face_tiles(mesh, 1.5)).items()):
+        ck.visit_strand_runs(mesh, twists, tiled, table, runs, loop_lookup)
+
+    def get_faces(builder):
+        vertex_params = np.frombuffer(builder.vertex_params, dtype=np.float32)
+        assert len(vertex_params) == len(builder.vertices)
+        assert len(set(v for face in builder.faces for v in face)) == len(builder.vertices)
+        return get_face_keys(np.array(builder.vertices), builder.faces, np.array(builder.uvs, dtype=np.float64),
+                             [tuple(np.round(vertex_params[face], 4)) for face in builder.faces])
+
+    assert get_faces(tiled) == get_faces(whole)
+
+
+def evaluate_beziers(segments, t):
+    """Evaluates each cubic bezier segment (an array of four control points) at its own t."""
+    t = t[:, None]
+    p0, p1, p2, p3 = (segments[:, i] for i in range(4))
+    return (1 - t) ** 3 * p0 + 3 * (1 - t) ** 2 * t * p1 + 3 * (1 - t) * t ** 2 * p2 + t ** 3 * p3
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_vector_segments(seed):
+    """Trimming a strand's segments moves their ends gap along the untrimmed curves either side of
+    under crossings, which split the strand into a piece each."""
+    mesh = random_mesh(seed)
+    knot_input = make_knot_input(mesh)
+    result = ck.compute_knot(knot_input, make_settings(twist_proportion=70))
+    geometry = result["geometry"]
+    origin, axes = ck.get_plane_axes(knot_input["co"], knot_input["loop_verts"],
+                                     knot_input["face_starts"], knot_input["face_sizes"])
+    curves = ck.get_plane_curves(result, origin, axes)
+    under = ck.get_under_points(geometry)
+    next_parts = geometry.next_parts
+    starts = result["strand_starts"]
+    ends = np.append(starts[1:], len(under))
+    gap = 0.2
+    for start, end in zip(starts, ends):
+        untrimmed = ck.get_vector_segments(curves, next_parts, under, start, end, 0)
+        trimmed = ck.get_vector_segments(curves, next_parts, under, start, end, gap)
+        points, handle_rights, handle_lefts = curves
+        assert np.allclose(untrimmed[:, 0], points[start:end])
+        assert np.allclose(untrimmed[:, 1], handle_rights[start:end])
+        assert np.allclose(untrimmed[:, 2], handle_lefts[next_parts[start:end]])
+        assert np.allclose(untrimmed[:, 3], points[next_parts[start:end]])
+        t0 = np.where(under[start:end], gap, 0)
+        t1 = np.where(under[next_parts[start:end]], 1 - gap, 1)
+        assert np.allclose(trimmed[:, 0], evaluate_beziers(untrimmed, t0))
+        assert np.allclose(trimmed[:, 3], evaluate_beziers(untrimmed, t1))
+
+        pieces = list(ck.get_strand_pieces(trimmed, under[start:end]))
+        under_count = under[start:end].sum()
+        assert len(pieces) == max(under_count, 1)
+        assert all(closed == (under_count == 0) for segments, closed in pieces)
+        assert sum(len(segments) for segments, closed in pieces) == end - start
+
+
+def write_grid_obj(path, width, height):
+    with open(path, "w") as file:
+        for y in range(height + 1):
+            for x in range(width + 1):
+                file.write("v {} {} 0\n".format(x, y))
+        for y in range(height):
+            for x in range(width):
+                a = y * (width + 1) + x + 1
+                file.write("f {} {} {} {}\n".format(a, a + 1, a + width + 2, a + width + 1))
+
+
+def test_export_obj(tmp_path):
+    """Exporting an OBJ writes an SVG path per strand, with a subpath per piece,
+    and G-code turning the laser on and off once per piece."""
+    obj_path = str(tmp_path / "grid.obj")
+    write_grid_obj(obj_path, 4, 3)
+    knot_input = ck.read_obj_input(obj_path)
+    assert len(knot_input["co"]) == 20 and len(knot_input["face_sizes"]) == 12
+    result = ck.compute_knot(knot_input, make_settings(twist_proportion=100))
+    under = ck.get_under_points(result["geometry"])
+    starts = result["strand_starts"]
+    under_counts = np.add.reduceat(under, starts) if len(starts) else np.zeros(0, dtype=int)
+    piece_count = np.maximum(under_counts, 1).sum()
+    assert len(starts) > 0 and under.any()
+
+    svg_path = str(tmp_path / "knot.svg")
+    ck.export_obj_knot([obj_path, svg_path, "--scale", "10"])
+    with open(svg_path) as file:
+        svg = file.read()
+    assert svg.startswith("<?xml") and svg.rstrip().endswith("</svg>")
+    paths = [line for line in svg.splitlines() if line.startswith("<path")]
+    assert len(paths) == len(starts)
+    assert sum(path.count("M") for path in paths) == piece_count
+    assert sum(path.count("Z") for path in paths) == (under_counts == 0).sum()
+    # The grid is 4 by 3 mesh units, and the knot lies within it
+    width, height = (float(x) for x in svg.split('viewBox="0 0 ')[1].split('"')[0].split())
+    assert width <= 40 + 1 and height <= 30 + 1
+
+    gcode_path = str(tmp_path / "knot.gcode")
+    ck.export_obj_knot([obj_path, gcode_path, "--scale", "10", "--curve-samples", "4"])
+    with open(gcode_path) as file:
+        commands = [line.split()[0] for line in file.read().splitlines()]
+    assert commands[:3] == ["G21", "G90", "M5"] and commands[-1] == "M2"
+    laser = [command for command in commands[3:] if command in ("M3", "M5")]
+    assert laser == ["M3", "M5"] * piece_count
+    # A rapid move to the start of each piece, then the samples of each of its segments
+    assert commands.count("G0") == piece_count + 1
+    assert commands.count("G1") == piece_count + 4 * len(under)
+
+
+def get_time(function, *args):
+    """The shortest time per call of function, timed in batches long enough to not be noise."""
+    timer = timeit.Timer(lambda: function(*args))
+    number, _ = timer.autorange()
+    return min(timer.repeat(3, number)) / number
+
+
+def make_grid(face_count):
+    width = int(sqrt(face_count))
+    vertices, faces = random_mesh_data(Random(0), width, width)
+    return ck.PyMesh(vertices, faces)
+
+
+def make_twists(face_count):
+    mesh = make_grid(face_count)
+    return mesh, ck.get_celtic_twists(mesh, 0.5)
+
+
+def trace(mesh, twists):
+    ck.visit_strands(mesh, twists, ck.StrandTableBuilder())
+
+
+def analyse(mesh, twists):
+    strand_analysis = ck.StrandAnalysisBuilder(mesh)
+    ck.visit_strands(mesh, twists, strand_analysis)
+    strand_analysis.get_braids()
+
+
+@pytest.mark.parametrize("function, make_args, sizes", [
+    (ck.remesh_medial, lambda n: (make_grid(n),), (1000, 2000, 4000, 8000)),
+    (ck.remesh_midedge_subdivision, lambda n: (make_grid(n),), (1000, 2000, 4000, 8000)),
+    (ck.get_celtic_twists, lambda n: (make_grid(n), 0.5), (1000, 2000, 4000, 8000)),
+    (trace, make_twists, (1000, 2000, 4000, 8000)),
+    (ck.get_strand_table, make_twists, (1000, 2000, 4000, 8000)),
+    (analyse, make_twists, (1000, 2000, 4000, 8000)),
+    (ck.get_twill_twists, lambda n: (make_grid(n),), (125, 250, 500, 1000)),
+], ids=["remesh_medial", "remesh_midedge_subdivision", "get_celtic_twists", "visit_strands",
+        "get_strand_table", "StrandAnalysisBuilder", "get_twill_twists"])
+def test_scaling(function, make_args, sizes):
+    """The time taken grows roughly linearly with the mesh size. The exponent is fitted over several sizes
+    (with timeit turning off garbage collection), and must be nearer linear than quadratic."""
+    times = [get_time(function, *make_args(size)) for size in sizes]
+    exponent = np.polyfit(np.log(sizes), np.log(times), 1)[0]
+    assert exponent < 1.5, "time grows like size ** {:.2f}: {}".format(exponent, times)